@@ -0,0 +1,163 @@
+from sqlalchemy import event, select
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from fastapi import Request
+from config import ASYNC_DATABASE_REPLICA_URL, ASYNC_DATABASE_URL, DATABASE_REPLICA_URL, DATABASE_URL
+from models import User, UserFilters, UserResponse, UserRecord
+from passwords import password_hasher
+from cache import cache_user, get_cached_user, get_cached_user_by_email, invalidate_user
+from replication import reads_from_primary
+from typing import AsyncIterator, Optional, Tuple
+
+# Reuse the schema and connection settings of the sync database module
+from database import USER_COLUMNS, DBUser, create_user_statement, cursor_name_statement, delete_user_statement, engine_options, set_sqlite_pragma, update_user_statement, users_json, users_statement, users_version_statement
+
+def to_async_url(url: URL) -> URL:
+    """Swaps the driver of a sync database URL for its asyncio counterpart."""
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql":
+        # psycopg 3 supports asyncio itself; other drivers are replaced by asyncpg
+        return url if url.get_driver_name() == "psycopg" else url.set(drivername="postgresql+asyncpg")
+    return url
+
+# Async counterpart of DATABASE_URL
+async_url = make_url(ASYNC_DATABASE_URL) if ASYNC_DATABASE_URL else to_async_url(make_url(DATABASE_URL))
+
+def create_engine_for(url: URL):
+    """Creates an async engine with the same pool settings and pragmas as the sync ones."""
+    new_engine = create_async_engine(url, **engine_options(url, is_async=True))
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", set_sqlite_pragma)
+    return new_engine
+
+async_engine = create_engine_for(async_url)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Optional read replica (see database.get_read_db)
+if DATABASE_REPLICA_URL:
+    async_replica_url = (
+        make_url(ASYNC_DATABASE_REPLICA_URL) if ASYNC_DATABASE_REPLICA_URL else to_async_url(make_url(DATABASE_REPLICA_URL))
+    )
+    async_replica_engine = create_engine_for(async_replica_url)
+    AsyncReplicaSessionLocal = async_sessionmaker(
+        async_replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+else:
+    async_replica_engine = async_engine
+    AsyncReplicaSessionLocal = AsyncSessionLocal
+
+async def dispose_engine():
+    """Closes pooled connections; aiosqlite runs each one on a thread that would otherwise keep the process alive."""
+    await async_engine.dispose()
+    if async_replica_engine is not async_engine:
+        await async_replica_engine.dispose()
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Dependency to get an async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db(request: Request) -> AsyncIterator[AsyncSession]:
+    """Dependency to get an async session for read-only endpoints (see database.get_read_db)."""
+    if async_replica_engine is async_engine or not reads_from_primary(request):
+        async with AsyncReplicaSessionLocal() as db:
+            yield db
+    else:
+        async with AsyncSessionLocal() as db:
+            db.info["skip_cache"] = True
+            yield db
+
+async def get_users_version(db: AsyncSession) -> int:
+    """Returns the change counter of the users table (see database.get_users_version)."""
+    return await db.scalar(users_version_statement())
+
+async def get_all_users_json(db: AsyncSession, filters: UserFilters) -> bytes:
+    """Returns the complete list of users matching the filters serialized as JSON, from Core rows (see database.get_all_users_json)."""
+    if filters.is_email_lookup():
+        user = await get_user_by_email(db, filters.email)
+        return users_json([] if user is None else [(user.id, user.name, user.email)])
+    return users_json(await db.execute(users_statement(filters)))
+
+async def get_users_page_json(db: AsyncSession, filters: UserFilters, after_id: int, limit: int) -> Tuple[bytes, Optional[int]]:
+    """Returns one page of users matching the filters serialized as JSON, plus the cursor for the next page (see database.get_users_page_json)."""
+    after_name = None
+    if filters.sort == "name" and after_id:
+        after_name = await db.scalar(cursor_name_statement(after_id))
+        if after_name is None:
+            raise ValueError("after_id does not refer to an existing user")
+    # Fetch one extra row to know whether another page exists
+    rows = (await db.execute(users_statement(filters, after_id, after_name).limit(limit + 1))).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return users_json(rows[:limit]), next_cursor
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[UserRecord]:
+    """Searches for and returns a user by their ID, from the cache when possible."""
+    cached = None if db.info.get("skip_cache") else get_cached_user(user_id)
+    if cached is not None:
+        return cached
+
+    user = (await db.execute(select(*USER_COLUMNS, DBUser.version).where(DBUser.id == user_id))).first()
+    if user:
+        result = UserRecord(id=user.id, name=user.name, email=user.email, version=user.version)
+        cache_user(result)
+        return result
+    return None
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[UserRecord]:
+    """Searches for and returns a user by their email, from the cache when possible."""
+    cached = None if db.info.get("skip_cache") else get_cached_user_by_email(email)
+    if cached is not None:
+        return cached
+
+    user = (await db.execute(select(*USER_COLUMNS, DBUser.version).where(DBUser.email == email).limit(1))).first()
+    if user:
+        result = UserRecord(id=user.id, name=user.name, email=user.email, version=user.version)
+        cache_user(result)
+        return result
+    return None
+
+async def create_new_user(db: AsyncSession, user: User) -> UserResponse:
+    """Creates a new user with a single INSERT ... RETURNING (see database.create_new_user)."""
+    # Hashing runs on the password hashing process pool without blocking the event loop
+    hashed_password = await password_hasher.hash_async(user.password)
+    try:
+        row = (await db.execute(create_user_statement(user, hashed_password))).one()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise ValueError("Email already registered")
+
+    # Drop any stale email mapping left behind by a deleted or renamed user
+    invalidate_user(row.id, row.email, version=1)
+
+    return UserResponse(id=row.id, name=row.name, email=row.email)
+
+async def update_user(db: AsyncSession, user_id: int, user: User) -> Optional[UserResponse]:
+    """Updates an existing user with a single UPDATE ... RETURNING (see database.update_user)."""
+    hashed_password = await password_hasher.hash_async(user.password)
+    try:
+        row = (await db.execute(update_user_statement(user_id, user, hashed_password))).first()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise ValueError("Email already registered")
+    if row is None:
+        return None
+
+    # A cached mapping from the previous email is dropped on its next lookup
+    invalidate_user(user_id, row.email, version=row.version)
+
+    return UserResponse(id=row.id, name=row.name, email=row.email)
+
+async def delete_user(db: AsyncSession, user_id: int) -> bool:
+    """Deletes a user from the database with a single DELETE ... RETURNING."""
+    row = (await db.execute(delete_user_statement(user_id))).first()
+    await db.commit()
+    if row is None:
+        return False
+
+    invalidate_user(user_id, row.email, version=None)
+    return True
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from typing import List, Optional
+from urllib.parse import urlencode
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Async counterparts of the CRUD endpoints in main.py, used when DB_ASYNC is enabled.
+# They await the async database layer instead of occupying a threadpool worker per request.
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from etags import etag_matches, user_etag, users_etag
+from models import User, UserFilters, UserResponse
+from async_database import get_users_version, get_all_users_json, get_users_page_json, get_user_by_id, create_new_user, update_user, delete_user, get_db, get_read_db, dispose_engine
+
+router = APIRouter(on_shutdown=[dispose_engine])
+
+# Endpoint to create a user (POST)
+@router.post("/users", response_model=UserResponse, status_code=201)
+async def create_user(user: User, db: AsyncSession = Depends(get_db)):
+    """
+    Creates a new user with a single INSERT; an email that is already in use
+    is rejected by the database's unique index.
+    """
+    try:
+        return await create_new_user(db, user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint to get all users (GET)
+@router.get("/users", response_model=List[UserResponse])
+async def get_users(
+    after_id: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    filters: UserFilters = Depends(),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Returns the list of users from the database, or a single page of it when
+    after_id or limit is given (see main.get_users).
+    """
+    page_size = None if after_id is None and limit is None else limit or DEFAULT_PAGE_SIZE
+
+    # The collection ETag only needs the table change counter, not the rows
+    etag = users_etag(await get_users_version(db), after_id, page_size, filters)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {"ETag": etag}
+
+    if page_size is None:
+        return Response(await get_all_users_json(db, filters), media_type="application/json", headers=headers)
+
+    try:
+        content, next_cursor = await get_users_page_json(db, filters, after_id or 0, page_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+        query = urlencode({**filters.query_params(), "after_id": next_cursor, "limit": page_size})
+        headers["Link"] = f'</users?{query}>; rel="next"'
+    return Response(content, media_type="application/json", headers=headers)
+
+# Endpoint to get a user by their ID (GET)
+@router.get("/users/{user_id}", response_model=UserResponse)
+async def get_user(user_id: int, response: Response, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_read_db)):
+    """
+    Searches for and returns a user by their ID from the database.
+    """
+    db_user = await get_user_by_id(db, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Answer conditional requests without serializing the body
+    etag = user_etag(db_user)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return db_user
+
+# Endpoint to update a user by their ID (PUT)
+@router.put("/users/{user_id}", response_model=UserResponse)
+async def update_user_endpoint(user_id: int, user: User, db: AsyncSession = Depends(get_db)):
+    """
+    Updates an existing user in the database.
+    """
+    try:
+        updated_user = await update_user(db, user_id, user)
+        if updated_user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return updated_user
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint to delete a user by their ID (DELETE)
+@router.delete("/users/{user_id}")
+async def delete_user_endpoint(user_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Deletes a user from the database.
+    """
+    success = await delete_user(db, user_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": "User deleted successfully"}
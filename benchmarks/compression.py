@@ -0,0 +1,67 @@
+"""
+Reports compression ratio and CPU cost of the response encodings on GET /users bodies.
+
+Bodies are built the way the lean read path builds them (database.users_json) from synthetic
+users, then compressed in one call with the middleware's Compressor at several levels.
+
+Usage:
+    python benchmarks/compression.py [--sizes 1000 10000 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import Compressor, brotli  # noqa: E402
+from fast_json import dumps_json  # noqa: E402
+
+GZIP_LEVELS = [1, 5, 9]
+BROTLI_QUALITIES = [1, 4, 6, 9]
+
+
+def users_body(count: int) -> bytes:
+    return dumps_json([{"id": i, "name": f"User {i}", "email": f"user{i}@example.com"} for i in range(1, count + 1)])
+
+
+def cpu_seconds(encoding: str, level: int, body: bytes, repeat: int):
+    """Returns the median CPU time of one compression and the compressed size."""
+    timings = []
+    for _ in range(repeat):
+        compressor = Compressor(encoding, gzip_level=level, brotli_quality=level)
+        started = time.process_time()
+        compressed = compressor.compress(body, final=True)
+        timings.append(time.process_time() - started)
+    return statistics.median(timings), len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="numbers of users")
+    parser.add_argument("--repeat", type=int, default=5, help="compressions per setting; the median is reported")
+    args = parser.parse_args()
+
+    settings = [("gzip", level) for level in GZIP_LEVELS]
+    if brotli is not None:
+        settings += [("br", quality) for quality in BROTLI_QUALITIES]
+    else:
+        print("brotli is not installed; only gzip is measured\n")
+
+    print(f"{'users':>8}{'encoding':>10}{'level':>7}{'bytes':>12}{'ratio':>8}{'cpu ms':>10}{'MB/s':>9}")
+    for count in args.sizes:
+        body = users_body(count)
+        print(f"{count:>8}{'identity':>10}{'-':>7}{len(body):>12,}{1:>8.1f}{0:>10.2f}{'-':>9}")
+        for encoding, level in settings:
+            seconds, size = cpu_seconds(encoding, level, body, args.repeat)
+            throughput = len(body) / seconds / 1e6 if seconds else float("inf")
+            print(
+                f"{count:>8}{encoding:>10}{level:>7}{size:>12,}{len(body) / size:>8.1f}"
+                f"{seconds * 1000:>10.2f}{throughput:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Compares write throughput of concurrent requests with and without group commit (write_queue.py).
+
+Each SQLite profile gets a fresh database file with the API's schema. Writer threads, standing in
+for concurrent POST /users requests, then create users through database.run_write:
+- direct: every write commits its own transaction, as with WRITE_QUEUE_ENABLED unset
+- grouped: writes are committed in batches by the group commit queue
+
+One write in --duplicate-every reuses an email that is already registered; those writes must
+fail alone, with an IntegrityError, while every other write succeeds.
+
+Usage:
+    python benchmarks/group_commit.py [--threads 32] [--writes 200] [--profiles safe balanced] [--dir .]
+
+Run it on the disk the database will live on: with synchronous=FULL every commit waits for
+fsync, which is what batching saves, and fsync is much cheaper on tmpfs than on a real disk.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the API's own engine off the filesystem; the benchmark creates one engine per profile
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, event, func, select  # noqa: E402
+from sqlalchemy.engine import make_url  # noqa: E402
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import database  # noqa: E402
+from config import WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_WAIT_MS  # noqa: E402
+from database import (  # noqa: E402
+    SQLITE_BASE_PRAGMAS, Base, DBUser, apply_sqlite_pragmas, create_user_statement, engine_options, run_write,
+    sqlite_profile_pragmas,
+)
+from models import User  # noqa: E402
+from write_queue import GroupCommitQueue  # noqa: E402
+
+# Stored as is; hashing is not what this benchmark measures
+HASHED_PASSWORD = "scrypt$16384$8$1$" + "00" * 16 + "$" + "00" * 32
+
+
+def create_profile_sessions(path: str, profile: str) -> sessionmaker:
+    """Creates a session factory on a new database file whose connections use the given profile."""
+    url = make_url(f"sqlite:///{path}")
+    # Enough connections for every writer thread in direct mode
+    engine = create_engine(url, **{**engine_options(url), "pool_size": 64, "max_overflow": 0})
+    pragmas = SQLITE_BASE_PRAGMAS + sqlite_profile_pragmas(profile)
+    event.listen(engine, "connect", lambda dbapi_connection, _: apply_sqlite_pragmas(dbapi_connection, pragmas))
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def run_writers(sessions: sessionmaker, threads: int, writes: int, duplicate_every: int) -> dict:
+    """Creates threads * writes users from concurrent threads and returns throughput and outcomes."""
+    counts = {"created": 0, "duplicates": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def writer(thread_index: int):
+        created = duplicates = errors = 0
+        with sessions() as db:
+            for i in range(writes):
+                duplicate = duplicate_every and i % duplicate_every == duplicate_every - 1
+                # Duplicates reuse the email of this thread's first user
+                email = f"user-{thread_index}-{0 if duplicate else i}@example.com"
+                statement = create_user_statement(User(name="Bench", email=email, password="x"), HASHED_PASSWORD)
+                try:
+                    run_write(db, lambda session: session.execute(statement).one())
+                    created += 1
+                except IntegrityError:
+                    duplicates += 1 if duplicate else 0
+                    errors += 0 if duplicate else 1
+        with lock:
+            counts["created"] += created
+            counts["duplicates"] += duplicates
+            counts["errors"] += errors
+
+    workers = [threading.Thread(target=writer, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+
+    with sessions() as db:
+        rows = db.scalar(select(func.count()).select_from(DBUser))
+    return {**counts, "rows": rows, "writes_per_second": threads * writes / seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32, help="concurrent writer threads")
+    parser.add_argument("--writes", type=int, default=200, help="writes per thread")
+    parser.add_argument("--duplicate-every", type=int, default=10, help="every Nth write reuses an email (0: never)")
+    parser.add_argument("--profiles", nargs="+", default=["safe", "balanced"], help="SQLite profiles to compare")
+    parser.add_argument("--max-batch", type=int, default=WRITE_QUEUE_MAX_BATCH, help="writes per group commit")
+    parser.add_argument("--max-wait-ms", type=float, default=WRITE_QUEUE_MAX_WAIT_MS, help="wait for a batch to fill")
+    parser.add_argument("--dir", default=None, help="directory for the database files (default: a temp dir)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="group-commit-", dir=args.dir)
+    expected_duplicates = args.threads * (args.writes // args.duplicate_every if args.duplicate_every else 0)
+    try:
+        print(f"{'profile':>10}{'mode':>9}{'writes/s':>11}{'speedup':>9}{'per batch':>11}{'rows':>8}{'dupes':>7}")
+        for profile in args.profiles:
+            baseline = None
+            for mode in ("direct", "grouped"):
+                sessions = create_profile_sessions(os.path.join(workdir, f"{profile}-{mode}.db"), profile)
+                queue = GroupCommitQueue(
+                    sessions.kw["bind"], enabled=mode == "grouped", max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000
+                )
+                # run_write commits through the module's queue, so swap in this run's one
+                database.write_queue = queue
+                queue.start()
+                try:
+                    result = run_writers(sessions, args.threads, args.writes, args.duplicate_every)
+                finally:
+                    queue.stop()
+                    sessions.kw["bind"].dispose()
+
+                if result["errors"] or result["duplicates"] != expected_duplicates \
+                        or result["rows"] != result["created"]:
+                    raise SystemExit(f"Unexpected write outcomes for {profile}/{mode}: {result}")
+                baseline = baseline or result["writes_per_second"]
+                stats = queue.stats()
+                per_batch = f"{stats['writes_per_batch']:.1f}" if mode == "grouped" else "1.0"
+                print(
+                    f"{profile:>10}{mode:>9}{result['writes_per_second']:>11.0f}"
+                    f"{result['writes_per_second'] / baseline:>8.1f}x{per_batch:>11}"
+                    f"{result['rows']:>8}{result['duplicates']:>7}"
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares GET /users on the lean read path with the ORM path it replaced.
+
+- orm: loads DBUser instances (password hashes included) into the session, copies them into
+  UserResponse models, and lets FastAPI validate and serialize them again via response_model
+- lean: selects id, name and email as Core rows and serializes them straight to JSON bytes
+
+Both variants are served by the API app through TestClient, against the same SQLite database,
+and must return identical bodies.
+
+Usage:
+    python benchmarks/list_users.py [--sizes 10000 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Point the API at a scratch database before it is imported; the benchmark also disables
+# background maintenance so it does not run during the measurements
+workdir = tempfile.mkdtemp(prefix="list-users-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+os.environ["DB_MAINTENANCE_INTERVAL"] = "0"
+
+from typing import List  # noqa: E402
+
+from fastapi import Depends  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import delete, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from database import DBUser, SessionLocal, get_db  # noqa: E402
+from main import app  # noqa: E402
+from models import UserResponse  # noqa: E402
+
+HASHED_PASSWORD = "scrypt$16384$8$1$" + "00" * 16 + "$" + "00" * 32
+
+
+# The implementation of GET /users before the lean read path
+@app.get("/benchmark/users-orm", response_model=List[UserResponse])
+def get_users_orm(db: Session = Depends(get_db)):
+    users = db.query(DBUser).all()
+    return [UserResponse(id=u.id, name=u.name, email=u.email) for u in users]
+
+
+def seed(rows: int):
+    """Replaces the users table contents with the given number of users."""
+    with SessionLocal() as db:
+        db.execute(delete(DBUser))
+        db.execute(
+            insert(DBUser),
+            [{"name": f"User {i}", "email": f"user{i}@example.com", "hashed_password": HASHED_PASSWORD} for i in range(rows)],
+        )
+        db.commit()
+
+
+def measure(client: TestClient, path: str, repeat: int):
+    """Returns the median latency in seconds and the body of the last response."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return statistics.median(timings), response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="numbers of users")
+    parser.add_argument("--repeat", type=int, default=5, help="requests per variant; the median is reported")
+    args = parser.parse_args()
+
+    print(f"{'users':>8}{'orm ms':>12}{'lean ms':>12}{'speedup':>10}{'body MB':>10}")
+    with TestClient(app) as client:
+        for rows in args.sizes:
+            seed(rows)
+            # Warm up the page cache and the connection pool
+            client.get("/users")
+            orm_seconds, orm_body = measure(client, "/benchmark/users-orm", args.repeat)
+            lean_seconds, lean_body = measure(client, "/users", args.repeat)
+            if orm_body != lean_body:
+                raise SystemExit(f"Response bodies differ at {rows} users")
+            print(
+                f"{rows:>8}{orm_seconds * 1000:>12.1f}{lean_seconds * 1000:>12.1f}"
+                f"{orm_seconds / lean_seconds:>9.1f}x{len(lean_body) / 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
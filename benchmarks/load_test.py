@@ -0,0 +1,410 @@
+"""
+Load test of the user API: drives a weighted mix of the CRUD endpoints at a fixed concurrency or
+request rate against a uvicorn server it starts itself, and reports throughput, latency
+percentiles and error rates.
+
+Operations, weighted with --mix:
+- list: GET /users?limit=100
+- get: GET /users/{user_id} of a seeded user
+- create: POST /users with a new email
+- update: PUT /users/{user_id} of a seeded user, keeping its email
+- delete: DELETE /users/{user_id} of a user created during the run (a create when there is none yet)
+
+Load models:
+- closed loop (default): --concurrency clients, each sending its next request as soon as the
+  previous one is answered
+- open loop (--rate): requests start on a fixed schedule, whatever the server's speed, with at
+  most --concurrency in flight. Latency counts from the scheduled start, so a server that falls
+  behind shows it in the percentiles instead of slowing the client down (coordinated omission)
+
+The server runs from this checkout on a fresh SQLite database in a temporary directory, seeded
+with --seed-users users through POST /users/bulk. Server settings are passed with --env, e.g.
+--env WRITE_QUEUE_ENABLED=1 or --env SCRYPT_N=1024. Requests sent during --warmup are not
+counted. Results can be saved as JSON with --output, and --compare prints the change against
+an earlier result file.
+
+Usage:
+    python benchmarks/load_test.py [--duration 30] [--concurrency 32 | --rate 500]
+        [--mix list=10,get=60,create=10,update=10,delete=10] [--workers 1] [--env NAME=VALUE ...]
+        [--output results.json] [--compare baseline.json]
+
+Requires httpx (pip install httpx). The client shares the machine with the server; the report
+shows the client's CPU use, and a client near 100% limits the throughput it can measure.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+try:
+    # Optional dependency: pip install httpx
+    import httpx
+except ImportError:
+    httpx = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATIONS = ("list", "get", "create", "update", "delete")
+DEFAULT_MIX = "list=10,get=60,create=10,update=10,delete=10"
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+BULK_CHUNK_SIZE = 1000
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("the mix needs at least one operation with a positive weight")
+    return mix
+
+
+def parse_env(value: str):
+    name, sep, setting = value.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {value!r}")
+    return name, setting
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(math.ceil(fraction * len(sorted_values)) - 1, 0))]
+
+
+class Recorder:
+    """Latencies and outcomes per operation, for requests started inside the measured window."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        self.errors: Dict[str, Counter] = {name: Counter() for name in OPERATIONS}
+
+    def record(self, operation: str, seconds: float, error: Optional[str]):
+        self.latencies[operation].append(seconds)
+        if error is not None:
+            self.errors[operation][error] += 1
+
+    def summary(self, duration: float) -> Dict[str, object]:
+        endpoints = {}
+        for name in OPERATIONS:
+            if self.latencies[name]:
+                endpoints[name] = self._summarize(self.latencies[name], self.errors[name], duration)
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        all_errors = sum(self.errors.values(), Counter())
+        return {"total": self._summarize(all_latencies, all_errors, duration), "endpoints": endpoints}
+
+    @staticmethod
+    def _summarize(latencies: List[float], errors: Counter, duration: float) -> Dict[str, object]:
+        ordered = sorted(latencies)
+        error_count = sum(errors.values())
+        result = {
+            "requests": len(ordered),
+            "throughput": len(ordered) / duration,
+            "errors": error_count,
+            "error_rate": error_count / len(ordered) if ordered else 0.0,
+            "error_kinds": dict(errors),
+            "mean_ms": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+            "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+        }
+        for label, fraction in PERCENTILES:
+            result[f"{label}_ms"] = percentile(ordered, fraction) * 1000
+        return result
+
+
+class Workload:
+    """Issues the operations of the mix against the API and tracks the users they need."""
+
+    def __init__(self, client: "httpx.AsyncClient", mix: Dict[str, float], seeded: List[dict], seed: int):
+        self.client = client
+        self.names = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.names]
+        self.seeded = seeded
+        self.created: List[int] = []
+        self.random = random.Random(seed)
+        self.run_id = f"{int(time.time())}-{os.getpid()}"
+        self.counter = 0
+
+    def choose(self) -> str:
+        operation = self.random.choices(self.names, self.weights)[0]
+        if operation == "delete" and not self.created:
+            return "create"
+        return operation
+
+    async def run(self, operation: str) -> Optional[str]:
+        """Sends one request; returns None on success, otherwise a short description of the error."""
+        try:
+            if operation == "list":
+                response = await self.client.get("/users", params={"limit": 100})
+                expected = 200
+            elif operation == "get":
+                response = await self.client.get(f"/users/{self.random.choice(self.seeded)['id']}")
+                expected = 200
+            elif operation == "create":
+                self.counter += 1
+                email = f"load-{self.run_id}-{self.counter}@example.com"
+                response = await self.client.post("/users", json={"name": "Load Test", "email": email, "password": "load-test"})
+                expected = 201
+                if response.status_code == expected:
+                    self.created.append(response.json()["id"])
+            elif operation == "update":
+                user = self.random.choice(self.seeded)
+                self.counter += 1
+                body = {"name": f"Load Test {self.counter}", "email": user["email"], "password": "load-test"}
+                response = await self.client.put(f"/users/{user['id']}", json=body)
+                expected = 200
+            else:
+                user_id = self.created.pop(self.random.randrange(len(self.created)))
+                response = await self.client.delete(f"/users/{user_id}")
+                expected = 200
+        except httpx.HTTPError as e:
+            return type(e).__name__
+        return None if response.status_code == expected else f"HTTP {response.status_code}"
+
+
+async def closed_loop(workload: Workload, recorder: Recorder, concurrency: int, measure_from: float, until: float):
+    async def client_loop():
+        while time.perf_counter() < until:
+            operation = workload.choose()
+            started = time.perf_counter()
+            error = await workload.run(operation)
+            if started >= measure_from:
+                recorder.record(operation, time.perf_counter() - started, error)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+
+
+async def open_loop(workload: Workload, recorder: Recorder, rate: float, concurrency: int, measure_from: float, until: float):
+    slots = asyncio.Semaphore(concurrency)
+    interval = 1 / rate
+
+    async def scheduled_request(scheduled: float):
+        operation = workload.choose()
+        async with slots:
+            error = await workload.run(operation)
+        if scheduled >= measure_from:
+            # Measured from the scheduled start, including any wait for a free slot
+            recorder.record(operation, time.perf_counter() - scheduled, error)
+
+    tasks = []
+    scheduled = time.perf_counter()
+    while scheduled < until:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(scheduled_request(scheduled)))
+        scheduled += interval
+    await asyncio.gather(*tasks)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir: str, port: int, workers: int, env: Dict[str, str]) -> subprocess.Popen:
+    """Initializes a fresh database and starts uvicorn on it from this checkout."""
+    server_env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        **env,
+    }
+    subprocess.run(
+        [sys.executable, "init_db.py"], cwd=REPO_DIR, env=server_env, check=True, stdout=subprocess.DEVNULL
+    )
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_DIR, env=server_env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def wait_until_ready(client: "httpx.AsyncClient", server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("the server exited during startup")
+        try:
+            if (await client.get("/users", params={"limit": 1})).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("the server did not start in time")
+
+
+async def seed_users(client: "httpx.AsyncClient", count: int) -> List[dict]:
+    """Creates the users that get and update operate on, through POST /users/bulk."""
+    users = []
+    for start in range(0, count, BULK_CHUNK_SIZE):
+        batch = [
+            {"name": f"Seed User {i}", "email": f"seed-{i}@example.com", "password": "load-test"}
+            for i in range(start, min(start + BULK_CHUNK_SIZE, count))
+        ]
+        response = await client.post("/users/bulk", json=batch, timeout=600)
+        response.raise_for_status()
+        users += [result["user"] for result in response.json() if result["success"]]
+    return users
+
+
+async def run_load(args, server: subprocess.Popen, base_url: str) -> Dict[str, object]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        await wait_until_ready(client, server)
+        seeded = await seed_users(client, args.seed_users)
+        if not seeded:
+            raise RuntimeError("no users could be seeded")
+
+        workload = Workload(client, args.mix, seeded, args.random_seed)
+        recorder = Recorder()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        measure_from = started + args.warmup
+        until = measure_from + args.duration
+        if args.rate:
+            await open_loop(workload, recorder, args.rate, args.concurrency, measure_from, until)
+        else:
+            await closed_loop(workload, recorder, args.concurrency, measure_from, until)
+        client_cpu = (time.process_time() - cpu_started) / (time.perf_counter() - started)
+
+    summary = recorder.summary(args.duration)
+    summary["client_cpu"] = client_cpu
+    return summary
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict[str, object]):
+    header = f"{'endpoint':>10}{'requests':>10}{'req/s':>10}"
+    header += "".join(f"{label + ' ms':>11}" for label, _ in PERCENTILES)
+    header += f"{'errors':>8}{'error %':>9}"
+    print(header)
+    rows = list(results["endpoints"].items()) + [("total", results["total"])]
+    for name, stats in rows:
+        line = f"{name:>10}{stats['requests']:>10}{stats['throughput']:>10.1f}"
+        line += "".join(f"{stats[label + '_ms']:>11.2f}" for label, _ in PERCENTILES)
+        line += f"{stats['errors']:>8}{stats['error_rate'] * 100:>8.2f}%"
+        print(line)
+    if results["total"]["error_kinds"]:
+        print("errors: " + ", ".join(f"{kind} x{count}" for kind, count in results["total"]["error_kinds"].items()))
+    print(f"client CPU: {results['client_cpu'] * 100:.0f}% of one core")
+
+
+def print_comparison(results: Dict[str, object], baseline: Dict[str, object]):
+    """Prints throughput and p99 changes per endpoint; positive p99 changes are slowdowns."""
+    print(f"\nCompared with {baseline.get('started_at', 'baseline')} ({(baseline.get('git_commit') or '?')[:10]}):")
+    print(f"{'endpoint':>10}{'req/s':>12}{'change':>9}{'p99 ms':>12}{'change':>9}")
+    old_rows = dict(baseline["results"]["endpoints"], total=baseline["results"]["total"])
+    new_rows = dict(results["endpoints"], total=results["total"])
+    for name, stats in new_rows.items():
+        old = old_rows.get(name)
+        if old is None:
+            continue
+        throughput_change = (stats["throughput"] / old["throughput"] - 1) * 100 if old["throughput"] else 0.0
+        p99_change = (stats["p99_ms"] / old["p99_ms"] - 1) * 100 if old["p99_ms"] else 0.0
+        print(
+            f"{name:>10}{stats['throughput']:>12.1f}{throughput_change:>+8.1f}%"
+            f"{stats['p99_ms']:>12.2f}{p99_change:>+8.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument("--concurrency", type=int, default=32, help="clients, or the most requests in flight with --rate")
+    parser.add_argument("--rate", type=float, default=None, help="requests per second (open loop)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed-users", type=int, default=1000, help="users created before the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--env", type=parse_env, action="append", default=[], help="server setting as NAME=VALUE; repeatable")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed")
+    parser.add_argument("--random-seed", type=int, default=1, help="seed of the operation sequence")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    if httpx is None:
+        raise SystemExit("The load test needs httpx: pip install httpx")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    env = dict(args.env)
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    port = free_port()
+    server = start_server(workdir, port, args.workers, env)
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    try:
+        results = asyncio.run(run_load(args, server, f"http://127.0.0.1:{port}"))
+    except RuntimeError as e:
+        with open(os.path.join(workdir, "server.log"), errors="replace") as log:
+            print(log.read()[-4000:], file=sys.stderr)
+        raise SystemExit(f"Load test failed: {e}")
+    finally:
+        stop_server(server)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    mode = f"{args.rate:g} req/s open loop, at most {args.concurrency} in flight" if args.rate \
+        else f"{args.concurrency} concurrent clients"
+    print(f"{args.duration:g}s at {mode}, {args.workers} worker(s)" + (f", env {env}" if env else "") + "\n")
+    print_report(results)
+    if baseline is not None:
+        print_comparison(results, baseline)
+
+    if args.output:
+        document = {
+            "started_at": started_at,
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "duration": args.duration, "warmup": args.warmup, "concurrency": args.concurrency, "rate": args.rate,
+                "mix": args.mix, "seed_users": args.seed_users, "workers": args.workers, "env": env,
+                "timeout": args.timeout, "random_seed": args.random_seed,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measures the cost of the /metrics instrumentation (metrics.py).
+
+- request: MetricsMiddleware around an ASGI app that answers immediately, compared with the bare
+  app, so the difference is what the middleware adds to every request
+- query: SELECT 1 on an engine with and without the cursor event hooks, so the difference is
+  what they add to every database query
+
+Usage:
+    python benchmarks/metrics_overhead.py [--requests 200000] [--queries 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from metrics import MetricsMiddleware, MetricsRegistry, current_request, RequestStats, instrument_engine  # noqa: E402
+
+SCOPE = {"type": "http", "method": "GET", "path": "/users/1", "headers": []}
+
+
+class _Route:
+    path = "/users/{user_id}"
+
+
+async def app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def time_requests(asgi_app, requests: int) -> float:
+    """Returns the mean time of one request, in seconds."""
+    started = time.perf_counter()
+    for _ in range(requests):
+        await asgi_app(dict(SCOPE), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def time_queries(instrumented: bool, queries: int) -> float:
+    """Returns the mean time of one SELECT 1 inside a request, in seconds."""
+    engine = create_engine("sqlite://")
+    if instrumented:
+        instrument_engine(engine)
+    token = current_request.set(RequestStats())
+    try:
+        with engine.connect() as connection:
+            statement = "SELECT 1"
+            started = time.perf_counter()
+            for _ in range(queries):
+                connection.exec_driver_sql(statement).scalar()
+            return (time.perf_counter() - started) / queries
+    finally:
+        current_request.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000, help="requests per variant")
+    parser.add_argument("--queries", type=int, default=100000, help="queries per variant")
+    args = parser.parse_args()
+
+    bare = asyncio.run(time_requests(app, args.requests))
+    measured = asyncio.run(time_requests(MetricsMiddleware(app, MetricsRegistry()), args.requests))
+    plain_query = time_queries(False, args.queries)
+    hooked_query = time_queries(True, args.queries)
+
+    print(f"{'':>10}{'bare us':>10}{'with us':>10}{'overhead us':>13}")
+    print(f"{'request':>10}{bare * 1e6:>10.2f}{measured * 1e6:>10.2f}{(measured - bare) * 1e6:>13.2f}")
+    print(f"{'query':>10}{plain_query * 1e6:>10.2f}{hooked_query * 1e6:>10.2f}{(hooked_query - plain_query) * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Compares read and write throughput of the SQLite performance profiles (database.SQLITE_PROFILES).
+
+Each profile gets a fresh database file with the API's schema and change-counter triggers, then runs:
+- commits: single-user INSERTs, each in its own transaction, as POST /users does
+- bulk insert: the seed rows inserted with one executemany, as POST /users/bulk does
+- point reads: lookups by primary key, as GET /users/{user_id} does on a cache miss
+- full scans: reads of every row, as GET /users does
+
+Usage:
+    python benchmarks/sqlite_profiles.py [--rows 50000] [--commits 2000] [--reads 20000] [--dir .]
+
+Run it on the disk the database will live on: fsync costs, which separate the profiles on
+commits, are much lower on tmpfs than on a real disk.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the API's own engine off the filesystem; the benchmark creates one engine per profile
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, event, insert, select  # noqa: E402
+from sqlalchemy.engine import make_url  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import (  # noqa: E402
+    SQLITE_BASE_PRAGMAS, SQLITE_PROFILES, Base, DBUser, apply_sqlite_pragmas, create_user_statement,
+    engine_options, sqlite_profile_pragmas,
+)
+from models import User  # noqa: E402
+
+# Stored as is; hashing is not what this benchmark measures
+HASHED_PASSWORD = "scrypt$16384$8$1$" + "00" * 16 + "$" + "00" * 32
+
+
+def create_profile_engine(path: str, profile: str):
+    """Creates an engine on a new database file whose connections use the given profile."""
+    url = make_url(f"sqlite:///{path}")
+    engine = create_engine(url, **engine_options(url))
+    pragmas = SQLITE_BASE_PRAGMAS + sqlite_profile_pragmas(profile)
+    event.listen(engine, "connect", lambda dbapi_connection, _: apply_sqlite_pragmas(dbapi_connection, pragmas))
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def timed(operations: int, run) -> float:
+    """Runs the workload and returns its throughput in operations per second."""
+    started = time.perf_counter()
+    run()
+    return operations / (time.perf_counter() - started)
+
+
+def benchmark_profile(path: str, profile: str, rows: int, commits: int, reads: int, scans: int) -> dict:
+    engine = create_profile_engine(path, profile)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    def run_commits():
+        with Session() as db:
+            for i in range(commits):
+                user = User(name=f"Commit {i}", email=f"commit{i}@example.com", password="unused1")
+                db.execute(create_user_statement(user, HASHED_PASSWORD))
+                db.commit()
+
+    def run_bulk_insert():
+        with Session() as db:
+            db.execute(
+                insert(DBUser),
+                [
+                    {"name": f"User {i}", "email": f"user{i}@example.com", "hashed_password": HASHED_PASSWORD}
+                    for i in range(rows)
+                ],
+            )
+            db.commit()
+
+    total = rows + commits
+    ids = [random.randint(1, total) for _ in range(reads)]
+
+    def run_point_reads():
+        with Session() as db:
+            for user_id in ids:
+                db.execute(select(DBUser.id, DBUser.name, DBUser.email).where(DBUser.id == user_id)).first()
+
+    def run_scans():
+        with Session() as db:
+            for _ in range(scans):
+                db.execute(select(DBUser.id, DBUser.name, DBUser.email)).all()
+
+    results = {
+        "commits/s": timed(commits, run_commits),
+        "bulk rows/s": timed(rows, run_bulk_insert),
+        "point reads/s": timed(reads, run_point_reads),
+        "scanned rows/s": timed(scans * total, run_scans),
+    }
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="rows inserted in bulk before the reads")
+    parser.add_argument("--commits", type=int, default=2000, help="single-row transactions")
+    parser.add_argument("--reads", type=int, default=20000, help="primary key lookups")
+    parser.add_argument("--scans", type=int, default=5, help="full table scans")
+    parser.add_argument("--dir", default=".", help="directory for the temporary database files")
+    parser.add_argument("--profiles", nargs="+", default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sqlite-profiles-", dir=args.dir)
+    try:
+        results = {}
+        for profile in args.profiles:
+            path = os.path.join(workdir, f"{profile}.db")
+            results[profile] = benchmark_profile(path, profile, args.rows, args.commits, args.reads, args.scans)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    metrics = list(next(iter(results.values())))
+    print(f"{'profile':<10}" + "".join(f"{metric:>16}" for metric in metrics))
+    for profile, values in results.items():
+        print(f"{profile:<10}" + "".join(f"{values[metric]:>16,.0f}" for metric in metrics))
+
+
+if __name__ == "__main__":
+    main()
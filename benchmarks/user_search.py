@@ -0,0 +1,116 @@
+"""
+Compares GET /users/search on the users_fts index with the LIKE scan it avoids.
+
+- fts: the statement GET /users/search runs, a trigram FTS5 lookup ranked by BM25
+- like: name LIKE '%term%' OR email LIKE '%term%', which reads every row of the users table
+
+Both return the first page of matches for the same queries. The tables, search index and
+triggers come from the API's own metadata, and users are indexed by the triggers as they are
+inserted, as in production.
+
+A LIKE scan stops as soon as it has found a page of matches in ID order, so it is fast for terms
+that match a large share of the table; ranking must score every match instead. Searches for
+rare terms, and the pages a LIKE scan has to read the whole table for, are where the index wins.
+
+Usage:
+    python benchmarks/user_search.py [--rows 1000000] [--repeat 5]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+workdir = tempfile.mkdtemp(prefix="user-search-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+from sqlalchemy import insert, or_, select, text  # noqa: E402
+
+from database import USER_COLUMNS, DBUser, SessionLocal, search_users_statement  # noqa: E402
+
+HASHED_PASSWORD = "scrypt$16384$8$1$" + "00" * 16 + "$" + "00" * 32
+FIRST_NAMES = ["Alice", "Bob", "Carol", "Dave", "Erin", "Frank", "Grace", "Heidi", "Ivan", "Judy"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Wilson", "Moore"]
+
+# Selective, unmatched, common and multi-term queries
+QUERIES = ["user123456", "user99999", "nobody", "grace", "alice smith", "example.org"]
+PAGE_SIZE = 20
+
+
+def seed(rows: int, batch_size: int = 50000):
+    with SessionLocal() as db:
+        for start in range(0, rows, batch_size):
+            db.execute(insert(DBUser), [
+                {
+                    "name": f"{FIRST_NAMES[i % 10]} {LAST_NAMES[i // 10 % 10]}",
+                    "email": f"user{i}@example.{'org' if i % 7 == 0 else 'com'}",
+                    "email_domain": f"example.{'org' if i % 7 == 0 else 'com'}",
+                    "hashed_password": HASHED_PASSWORD,
+                }
+                for i in range(start, min(start + batch_size, rows))
+            ])
+        db.commit()
+
+
+def like_statement(query: str):
+    conditions = [
+        or_(DBUser.name.icontains(term, autoescape=True), DBUser.email.icontains(term, autoescape=True))
+        for term in query.split()
+    ]
+    return select(*USER_COLUMNS).where(*conditions).order_by(DBUser.id).limit(PAGE_SIZE)
+
+
+def measure(statement, repeat: int):
+    """Returns the median latency in seconds and the number of rows returned."""
+    timings = []
+    with SessionLocal() as db:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = db.execute(statement).all()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(rows)
+
+
+def index_size_mb() -> float:
+    with SessionLocal() as db:
+        return db.execute(text(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'users_fts%'"
+        )).scalar() / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000, help="number of users")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query; the median is reported")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(args.rows)
+    print(f"Seeded {args.rows:,} users in {time.perf_counter() - started:.1f}s")
+    try:
+        print(f"Search index size: {index_size_mb():.0f} MB\n")
+    except Exception:
+        # dbstat is an optional SQLite build feature
+        pass
+
+    print(f"{'query':>14}{'fts ms':>10}{'like ms':>10}{'speedup':>10}{'rows':>6}")
+    for query in QUERIES:
+        fts_seconds, fts_rows = measure(search_users_statement(query, PAGE_SIZE, 0), args.repeat)
+        like_seconds, like_rows = measure(like_statement(query), args.repeat)
+        if fts_rows != like_rows:
+            raise SystemExit(f"Result counts differ for {query!r}: {fts_rows} vs {like_rows}")
+        print(
+            f"{query:>14}{fts_seconds * 1000:>10.2f}{like_seconds * 1000:>10.2f}"
+            f"{like_seconds / fts_seconds:>9.1f}x{fts_rows:>6}"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,347 @@
+"""
+Read-through cache for user lookups, with pluggable storage backends.
+
+The memory backend keeps entries inside each process. The Redis backend keeps them in a
+server shared by every uvicorn worker, so a user cached by one worker is a hit for all of
+them, and invalidations made by one worker are seen by the others immediately.
+
+Cached users carry their row version. A write replaces the user's entry with a marker of its
+new version rather than deleting it, and entries are only stored over an older entry or marker.
+A lookup that read the row before a concurrent write committed, or from a replica that has not
+caught up with it, therefore cannot put the old row back into the cache after the write.
+"""
+
+import json
+import logging
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import CACHE_BACKEND, CACHE_REDIS_URL, USER_CACHE_SIZE, USER_CACHE_TTL
+from models import UserRecord
+
+logger = logging.getLogger(__name__)
+
+
+def _order(value: Any) -> float:
+    """Order of a cached value for set_if_newer; values without one sort first."""
+    return value.get("order", -1) if isinstance(value, dict) else -1
+
+
+class CacheBackend(ABC):
+    """
+    Interface for cache storage. Values must be JSON-serializable. Subclasses implement the
+    abstract methods; a backend missing one of them cannot be instantiated.
+    """
+
+    name = "base"
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[Any]:
+        """
+        Returns the cached value, or None if the key is missing or expired.
+        record_stats=False skips the hit/miss counters, for lookups that are part of another one.
+        """
+        value = self._get(key)
+        if record_stats:
+            if value is None:
+                self.record_miss()
+            else:
+                self.record_hit()
+        return value
+
+    def record_hit(self):
+        """Counts a hit for a lookup made of several uncounted gets."""
+        with self._stats_lock:
+            self.hits += 1
+
+    def record_miss(self):
+        """Counts a miss for a lookup made of several uncounted gets."""
+        with self._stats_lock:
+            self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the cache counters of this process."""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[Any]:
+        """Returns the stored value, or None; get() wraps it with the hit/miss counters."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any):
+        """Stores a value for ttl seconds."""
+
+    @abstractmethod
+    def set_if_newer(self, key: str, value: Dict[str, Any]) -> bool:
+        """
+        Stores a dict with an "order" number for ttl seconds, unless the key holds a value with
+        an equal or higher order. The check and the write are atomic. Returns whether it was stored.
+        """
+
+    @abstractmethod
+    def delete(self, *keys: str):
+        """Removes the given keys if present."""
+
+    @abstractmethod
+    def clear(self):
+        """Removes every entry, keeping the counters."""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Thread-safe in-process LRU cache with a time to live per entry."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Any):
+        """Stores a value, evicting the least recently used entries beyond maxsize."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._store(key, value)
+
+    def set_if_newer(self, key: str, value: Dict[str, Any]) -> bool:
+        if self.maxsize <= 0:
+            return False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= time.monotonic() and _order(entry[0]) >= value["order"]:
+                return False
+            self._store(key, value)
+            return True
+
+    def _store(self, key: str, value: Any):
+        # Called with the lock held
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update(
+                evictions=self.evictions,
+                expirations=self.expirations,
+                size=len(self._entries),
+                maxsize=self.maxsize,
+            )
+        return stats
+
+
+# Compares and sets in one step on the server, so no other worker can write in between
+SET_IF_NEWER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local ok, value = pcall(cjson.decode, current)
+    if ok and type(value) == 'table' and tonumber(value['order']) and tonumber(value['order']) >= tonumber(ARGV[2]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache shared by every worker, stored in a Redis-protocol server.
+    Expiry and eviction are handled by the server (SET ... EX and its maxmemory policy).
+    If the server is unreachable, lookups behave as misses and writes are skipped, so
+    requests fall back to the database instead of failing.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float, prefix: str = "users-api:"):
+        super().__init__(ttl)
+        # Optional dependency, only needed when CACHE_BACKEND=redis
+        import redis
+
+        self._redis = redis
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._set_if_newer = self._client.register_script(SET_IF_NEWER_SCRIPT)
+        self.prefix = prefix
+        self.errors = 0
+
+    def _on_error(self, error: Exception):
+        with self._stats_lock:
+            self.errors += 1
+        logger.warning("Redis cache unavailable: %s", error)
+
+    def _get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self._client.get(self.prefix + key)
+        except self._redis.RedisError as e:
+            self._on_error(e)
+            return None
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any):
+        try:
+            self._client.set(self.prefix + key, json.dumps(value), ex=max(1, int(self.ttl)))
+        except self._redis.RedisError as e:
+            self._on_error(e)
+
+    def set_if_newer(self, key: str, value: Dict[str, Any]) -> bool:
+        try:
+            return bool(self._set_if_newer(
+                keys=[self.prefix + key], args=[json.dumps(value), value["order"], max(1, int(self.ttl))]
+            ))
+        except self._redis.RedisError as e:
+            self._on_error(e)
+            return False
+
+    def delete(self, *keys: str):
+        if not keys:
+            return
+        try:
+            self._client.delete(*(self.prefix + key for key in keys))
+        except self._redis.RedisError as e:
+            # A failed invalidation can leave a stale entry for up to ttl seconds
+            self._on_error(e)
+
+    def clear(self):
+        try:
+            keys = list(self._client.scan_iter(match=self.prefix + "*"))
+            if keys:
+                self._client.delete(*keys)
+        except self._redis.RedisError as e:
+            self._on_error(e)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        # Server-side counters are shared by every worker
+        try:
+            info = self._client.info("stats")
+            stats.update(
+                server_hits=info.get("keyspace_hits"),
+                server_misses=info.get("keyspace_misses"),
+                evictions=info.get("evicted_keys"),
+                expirations=info.get("expired_keys"),
+            )
+        except self._redis.RedisError as e:
+            self._on_error(e)
+        stats["errors"] = self.errors
+        return stats
+
+
+def create_cache_backend() -> CacheBackend:
+    """Builds the cache backend selected by CACHE_BACKEND."""
+    if CACHE_BACKEND == "memory":
+        return MemoryCacheBackend(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+    if CACHE_BACKEND == "redis":
+        return RedisCacheBackend(url=CACHE_REDIS_URL, ttl=USER_CACHE_TTL)
+    raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+
+
+# Users are cached by ID; emails map to the ID so both lookups share one entry per user
+user_cache = create_cache_backend()
+
+# Order of the marker left by deleting a user: above every version, so the user is never cached
+# again until the marker expires. 2 ** 53 is exact in the doubles Redis' Lua uses
+DELETED_USER_ORDER = 2 ** 53
+
+
+def _entry_order(version: int) -> int:
+    # The entry of a version sorts after the marker left by the write that produced it
+    return 2 * version + 1
+
+
+def _marker_order(version: int) -> int:
+    return 2 * version
+
+
+def cache_user(user: UserRecord):
+    """
+    Stores a user under its ID and its email, unless the cache already holds the same or a
+    newer version of it, or a write has replaced it since the row was read.
+    """
+    if user_cache.set_if_newer(f"user:id:{user.id}", {**user.model_dump(), "order": _entry_order(user.version)}):
+        user_cache.set(f"user:email:{user.email}", user.id)
+
+
+def _cached_record(data: Optional[Dict[str, Any]]) -> Optional[UserRecord]:
+    # Markers left by writes have no user fields
+    if data is None or "email" not in data:
+        return None
+    return UserRecord(id=data["id"], name=data["name"], email=data["email"], version=data["version"])
+
+
+def get_cached_user(user_id: int) -> Optional[UserRecord]:
+    """Returns the cached user with this ID, if any."""
+    record = _cached_record(user_cache.get(f"user:id:{user_id}", record_stats=False))
+    if record is None:
+        user_cache.record_miss()
+    else:
+        user_cache.record_hit()
+    return record
+
+
+def get_cached_user_by_email(email: str) -> Optional[UserRecord]:
+    """Returns the cached user with this email, if any."""
+    user_id = user_cache.get(f"user:email:{email}", record_stats=False)
+    record = None if user_id is None else _cached_record(user_cache.get(f"user:id:{user_id}", record_stats=False))
+    if record is None or record.email != email:
+        # The mapping is missing, outlived the user entry, or the user's email has changed since
+        if user_id is not None:
+            user_cache.delete(f"user:email:{email}")
+        user_cache.record_miss()
+        return None
+    user_cache.record_hit()
+    return record
+
+
+def invalidate_user(user_id: int, *emails: str, version: Optional[int]):
+    """
+    Called after a committed write: replaces the cached entry of a user with a marker of the
+    version it now has (None once it is deleted), and drops the mappings of any of its current
+    or former emails.
+    """
+    order = DELETED_USER_ORDER if version is None else _marker_order(version)
+    user_cache.set_if_newer(f"user:id:{user_id}", {"order": order})
+    user_cache.delete(*(f"user:email:{email}" for email in emails))
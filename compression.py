@@ -0,0 +1,196 @@
+"""
+Negotiated response compression (brotli or gzip) for the API.
+
+Responses are compressed when the client accepts an encoding we support, the content type is
+text-like, and the body is at least COMPRESSION_MIN_SIZE bytes (streamed responses, whose size
+is unknown up front, are always compressed). Bodies of COMPRESSION_OFFLOAD_SIZE bytes or more
+are compressed on a worker thread, so a large GET /users never stalls the event loop; zlib and
+brotli release the GIL while they work. Compression levels are clamped to ranges meant for
+online compression: brotli qualities above 9 are orders of magnitude slower.
+"""
+
+import zlib
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    # Optional dependency: pip install brotli
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVELS = (1, 9)
+BROTLI_QUALITIES = (0, 9)
+
+COMPRESSIBLE_TYPES = frozenset({"application/json", "application/x-ndjson", "application/javascript"})
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Encodings this server can produce, in order of preference."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks the supported encoding with the highest q-value in an Accept-Encoding header."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        # Ties go to the earlier, preferred encoding
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def _mark_negotiated(headers: MutableHeaders):
+    """
+    Marks a response as chosen through Accept-Encoding. Compressed bytes are a different
+    representation of the same resource, so a strong ETag becomes weak; If-None-Match still
+    matches it by weak comparison.
+    """
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+
+def _clamp(value: int, bounds: Tuple[int, int]) -> int:
+    return min(max(value, bounds[0]), bounds[1])
+
+
+class Compressor:
+    """Incremental brotli or gzip compressor with a common interface."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(mode=brotli.MODE_TEXT, quality=_clamp(brotli_quality, BROTLI_QUALITIES))
+        else:
+            # wbits=31 writes a gzip header and trailer around the deflate stream
+            self._zlib = zlib.compressobj(_clamp(gzip_level, GZIP_LEVELS), zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool = False) -> bytes:
+        """Compresses the next chunk; the final chunk also flushes the stream."""
+        if self.encoding == "br":
+            return self._brotli.process(data) + (self._brotli.finish() if final else b"")
+        return self._zlib.compress(data) + (self._zlib.flush() if final else b"")
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses responses negotiated through Accept-Encoding."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int, offload_size: int, gzip_level: int, brotli_quality: int):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self, encoding, send).run(self.app, scope, receive)
+
+    async def compress(self, compressor: Compressor, data: bytes, final: bool) -> bytes:
+        """Compresses a chunk, on a worker thread when it is large."""
+        if len(data) >= self.offload_size:
+            return await anyio.to_thread.run_sync(compressor.compress, data, final)
+        return compressor.compress(data, final)
+
+
+class _CompressingResponder:
+    """Holds back the response start until the first body chunk shows whether to compress."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Message] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def run(self, app: ASGIApp, scope: Scope, receive: Receive):
+        await app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not self.should_compress(start, body, more_body):
+                self.passthrough = True
+                await self.send(self.uncompressed_start(start))
+                await self.send(message)
+                return
+            self.compressor = Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            compressed = await self.middleware.compress(self.compressor, body, final=not more_body)
+            await self.send(self.compressed_start(start, None if more_body else len(compressed)))
+        else:
+            compressed = await self.middleware.compress(self.compressor, body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    def should_compress(self, start: Message, body: bytes, more_body: bool) -> bool:
+        headers = Headers(raw=start["headers"])
+        if "content-encoding" in headers or not is_compressible(headers.get("content-type", "")):
+            return False
+        # Streamed bodies have an unknown size and are compressed as they go
+        return more_body or len(body) >= self.middleware.minimum_size
+
+    def compressed_start(self, start: Message, content_length: Optional[int]) -> Message:
+        headers = MutableHeaders(raw=list(start["headers"]))
+        headers["Content-Encoding"] = self.encoding
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        _mark_negotiated(headers)
+        return {**start, "headers": headers.raw}
+
+    def uncompressed_start(self, start: Message) -> Message:
+        """
+        Sends the headers of a compressed response on responses that could have been compressed:
+        a 304 revalidating a compressed response, and compressible bodies under the size
+        threshold. Clients then see the same weak ETag whether or not the body was compressed.
+        """
+        headers = MutableHeaders(raw=list(start["headers"]))
+        if "content-encoding" in headers:
+            return start
+        if start["status"] != 304 and not is_compressible(headers.get("content-type", "")):
+            return start
+        _mark_negotiated(headers)
+        return {**start, "headers": headers.raw}
@@ -1,52 +1,268 @@
-from sqlalchemy import create_engine, Column, Integer, String, event
+from sqlalchemy import create_engine, Column, DDL, Index, Integer, String, delete, event, func, insert, or_, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.engine import Engine
-from models import User, UserResponse
-from typing import List, Optional
-import sqlite3
+from fastapi import Request
+from config import (
+    DATABASE_REPLICA_URL, DATABASE_URL, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    SQLITE_OPTIMIZE_ON_SHUTDOWN, SQLITE_PRAGMA_OVERRIDES, SQLITE_PROFILE, WRITE_QUEUE_ENABLED, WRITE_QUEUE_MAX_BATCH,
+    WRITE_QUEUE_MAX_WAIT_MS,
+)
+from models import User, UserFilters, UserResponse, UserRecord, BulkUserResult
+from passwords import password_hasher
+from cache import cache_user, get_cached_user, get_cached_user_by_email, invalidate_user
+from replication import reads_from_primary
+from fast_json import dumps_json
+from write_queue import GroupCommitQueue, WriteOperation
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Maximum number of values bound into a single IN (...) lookup; SQLite before 3.32 allows at most
+# 999 bound parameters per statement, so longer lists are looked up in chunks
+IN_LOOKUP_CHUNK_SIZE = 500
 
-# Database configuration
-DATABASE_URL = "sqlite:///./test.db"
+# Milliseconds a connection waits for a lock held by another one before failing
+SQLITE_BUSY_TIMEOUT_MS = 30000
 
 # SQLite-specific configuration to enable WAL mode and proper locking
-@event.listens_for(Engine, "connect")
+SQLITE_BASE_PRAGMAS = [
+    # Enable WAL mode for better concurrency
+    "PRAGMA journal_mode=WAL",
+    # Set timeout for busy database
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    # Enable foreign keys
+    "PRAGMA foreign_keys=ON",
+]
+
+# Performance presets for SQLite, selected with SQLITE_PROFILE:
+# - safe: SQLite's defaults; every commit is fsynced, so no committed write is lost on power failure
+# - balanced: fsync only at checkpoints, which WAL makes safe against application crashes (a power
+#   failure can lose the last commits, never corrupt the database); 64 MiB page cache, 256 MiB of
+#   memory-mapped reads and temporary tables in memory
+# - fast: no fsync at all (a power failure can corrupt the database), larger caches and less frequent
+#   checkpoints; for scratch databases, tests and benchmarks
+SQLITE_PROFILES: Dict[str, Dict[str, str]] = {
+    "safe": {"synchronous": "FULL", "cache_size": "-2000", "mmap_size": "0", "temp_store": "DEFAULT", "wal_autocheckpoint": "1000"},
+    "balanced": {"synchronous": "NORMAL", "cache_size": "-65536", "mmap_size": "268435456", "temp_store": "MEMORY", "wal_autocheckpoint": "1000"},
+    "fast": {"synchronous": "OFF", "cache_size": "-262144", "mmap_size": "1073741824", "temp_store": "MEMORY", "wal_autocheckpoint": "10000"},
+}
+
+# Accepted values of the profile pragmas; the integer ones are validated separately
+SQLITE_PRAGMA_CHOICES = {
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+
+def sqlite_profile_pragmas(profile: str, overrides: Optional[Dict[str, str]] = None) -> List[str]:
+    """Returns the PRAGMA statements of a performance profile, with single values overridden."""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE: {profile}")
+    settings = {**SQLITE_PROFILES[profile], **(overrides or {})}
+    pragmas = []
+    for name, value in settings.items():
+        value = value.upper() if name in SQLITE_PRAGMA_CHOICES else value
+        valid = value in SQLITE_PRAGMA_CHOICES[name] if name in SQLITE_PRAGMA_CHOICES else value.lstrip("-").isdigit()
+        if not valid:
+            raise ValueError(f"Invalid value for SQLite pragma {name}: {value}")
+        pragmas.append(f"PRAGMA {name}={value}")
+    return pragmas
+
+SQLITE_PRAGMAS = SQLITE_BASE_PRAGMAS + sqlite_profile_pragmas(SQLITE_PROFILE, SQLITE_PRAGMA_OVERRIDES)
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: List[str]):
+    """Runs PRAGMA statements on a new DBAPI connection."""
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
 def set_sqlite_pragma(dbapi_connection, connection_record):
-    if isinstance(dbapi_connection, sqlite3.Connection):
-        cursor = dbapi_connection.cursor()
-        # Enable WAL mode for better concurrency
-        cursor.execute("PRAGMA journal_mode=WAL")
-        # Set timeout for busy database
-        cursor.execute("PRAGMA busy_timeout=30000")
-        # Enable foreign keys
-        cursor.execute("PRAGMA foreign_keys=ON")
-        cursor.close()
-
-# Create engine with specific SQLite configuration
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={
-        "check_same_thread": False,
-        "timeout": 30
-    },
-    echo=False,
-    pool_pre_ping=True
-)
+    """Applies SQLITE_PRAGMAS to each new connection; registered only on our SQLite engines."""
+    apply_sqlite_pragmas(dbapi_connection, SQLITE_PRAGMAS)
+
+def engine_options(url: URL, is_async: bool = False) -> Dict[str, Any]:
+    """Builds create_engine keyword arguments for a database URL from the pool settings in config."""
+    options: Dict[str, Any] = {
+        "echo": False,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if url.get_backend_name() == "sqlite":
+        connect_args: Dict[str, Any] = {"timeout": 30}
+        if not is_async:
+            connect_args["check_same_thread"] = False
+        options["connect_args"] = connect_args
+        # In-memory databases live in a single connection, which rules out a sized pool
+        if url.database in (None, "", ":memory:"):
+            return options
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+# Create engine from the configured URL (SQLite by default, PostgreSQL also supported)
+engine = create_engine(make_url(DATABASE_URL), **engine_options(make_url(DATABASE_URL)))
+IS_SQLITE = engine.dialect.name == "sqlite"
+if IS_SQLITE:
+    event.listen(engine, "connect", set_sqlite_pragma)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Optional read replica for the read endpoints; without one, reads use the primary engine
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(make_url(DATABASE_REPLICA_URL), **engine_options(make_url(DATABASE_REPLICA_URL)))
+    if replica_engine.dialect.name == "sqlite":
+        event.listen(replica_engine, "connect", set_sqlite_pragma)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+else:
+    replica_engine = engine
+    ReplicaSessionLocal = SessionLocal
 Base = declarative_base()
 
 # SQLAlchemy User Model
 class DBUser(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String)
     email = Column(String, unique=True, index=True)
+    # Lowercased part of the email after the "@", stored so domain filters can use an index
+    email_domain = Column(String, nullable=False, default="", server_default="")
     hashed_password = Column(String)
+    # Incremented on every update; used for the ETag of the user
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __table_args__ = (
+        # Serve name prefix filters and name-sorted pages in index order, with id as tiebreaker
+        Index("ix_users_name_id", "name", "id"),
+        # Serve email domain filters in id order, so their pages need no sort
+        Index("ix_users_email_domain_id", "email_domain", "id"),
+        # Never reuse the ID of a deleted user: SQLite would otherwise give it to the next user
+        # created after deleting the newest one, and that user, also at version 1, would get the
+        # deleted user's ETag (PostgreSQL sequences never go back)
+        {"sqlite_autoincrement": True},
+    )
+
+# Change counters per table, bumped by triggers on every write; used for collection ETags.
+# A table's version is the sum of its shards: PostgreSQL spreads concurrent writers over
+# several rows so they do not all queue on one row lock, while SQLite has a single writer
+# and a single shard.
+class DBTableVersion(Base):
+    __tablename__ = "table_versions"
+    name = Column(String, primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    version = Column(Integer, nullable=False, default=0)
+
+POSTGRES_VERSION_SHARDS = 16
+
+# Seed the users counter and keep it in step with every INSERT, UPDATE and DELETE,
+# whichever code path writes to the table
+SQLITE_USERS_VERSION_DDL = [
+    "INSERT OR IGNORE INTO table_versions (name, shard, version) VALUES ('users', 0, 0)",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS users_version_after_{operation.lower()} AFTER {operation} ON users
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'users' AND shard = 0;
+    END"""
+    for operation in ("INSERT", "UPDATE", "DELETE")
+]
+POSTGRES_USERS_VERSION_DDL = [
+    f"""INSERT INTO table_versions (name, shard, version)
+    SELECT 'users', shard, 0 FROM generate_series(0, {POSTGRES_VERSION_SHARDS - 1}) AS shard
+    ON CONFLICT DO NOTHING""",
+    # %% is a literal % once DDL() applies its string formatting
+    f"""CREATE OR REPLACE FUNCTION bump_users_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE table_versions SET version = version + 1
+        WHERE name = 'users' AND shard = pg_backend_pid() %% {POSTGRES_VERSION_SHARDS};
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS users_version_after_write ON users",
+    """CREATE TRIGGER users_version_after_write AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_users_version()""",
+]
+for statement in SQLITE_USERS_VERSION_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_USERS_VERSION_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+# Full-text index over user names and emails for GET /users/search on SQLite. It is an external
+# content FTS5 table: it stores only the index and reads the text from users, and triggers keep
+# it in step with every write. The trigram tokenizer indexes every 3-character substring, so
+# any substring of 3 or more characters can be searched without scanning the table.
+SQLITE_USERS_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        name, email, content='users', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_delete AFTER DELETE ON users
+    BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_update AFTER UPDATE OF name, email ON users
+    BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    # Index the users of a database created before the search table; a no-op once it is filled
+    """INSERT INTO users_fts (users_fts) SELECT 'rebuild'
+    WHERE EXISTS (SELECT 1 FROM users) AND NOT EXISTS (SELECT 1 FROM users_fts_docsize)""",
+]
+for statement in SQLITE_USERS_SEARCH_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+def optimize_database():
+    """
+    Runs PRAGMA optimize on SQLite, which analyzes the tables whose query planner statistics
+    are out of date. Called on shutdown when SQLITE_OPTIMIZE_ON_SHUTDOWN is enabled.
+    """
+    if IS_SQLITE and SQLITE_OPTIMIZE_ON_SHUTDOWN:
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA optimize")
+
+# Pragmas reported by GET /stats/database, read back from a connection of the primary engine
+REPORTED_SQLITE_PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "wal_autocheckpoint", "busy_timeout")
+
+def sqlite_settings() -> Dict[str, Any]:
+    """
+    Returns the SQLITE_PROFILE in use and the values of its pragmas on a live connection,
+    so overrides and pragmas SQLite refused are visible. Both are empty off SQLite.
+    """
+    if not IS_SQLITE:
+        return {"profile": None, "pragmas": {}}
+    with engine.connect() as connection:
+        pragmas = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in REPORTED_SQLITE_PRAGMAS}
+    return {"profile": SQLITE_PROFILE, "pragmas": pragmas}
+
+# Group commit of user writes; the API starts it on startup when WRITE_QUEUE_ENABLED is set
+write_queue = GroupCommitQueue(
+    engine, enabled=WRITE_QUEUE_ENABLED, max_batch=WRITE_QUEUE_MAX_BATCH, max_wait=WRITE_QUEUE_MAX_WAIT_MS / 1000
+)
+
+def run_write(db: SessionLocal, operation: WriteOperation) -> Any:
+    """
+    Runs a write and commits it, returning the operation's result. When the write queue is
+    running, the write is committed by its writer thread together with concurrent writes;
+    otherwise it runs on db in its own transaction. Errors raised by the operation, such as an
+    IntegrityError, reach the caller either way, with the write rolled back.
+    """
+    future = write_queue.submit(operation)
+    if future is not None:
+        return future.result()
+    try:
+        result = operation(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
 def get_db():
     """Dependency to get a database session."""
     db = SessionLocal()
@@ -55,66 +271,372 @@ def get_db():
     finally:
         db.close()
 
-def get_all_users(db: SessionLocal) -> List[UserResponse]:
-    """Returns the complete list of users."""
-    users = db.query(DBUser).all()
-    return [UserResponse(id=u.id, name=u.name, email=u.email) for u in users]
+def get_read_db(request: Request):
+    """
+    Dependency to get a database session for read-only endpoints.
+    It reads from the replica, unless the client wrote recently (see replication), in which
+    case it reads from the primary and bypasses cached users, which may have been filled from
+    a replica that had not caught up with the write yet.
+    """
+    if replica_engine is engine or not reads_from_primary(request):
+        db = ReplicaSessionLocal()
+    else:
+        db = SessionLocal()
+        db.info["skip_cache"] = True
+    try:
+        yield db
+    finally:
+        db.close()
+
+def users_version_statement():
+    """Builds the query for the change counter of the users table, shared with async_database."""
+    return select(func.coalesce(func.sum(DBTableVersion.version), 0)).where(DBTableVersion.name == "users")
+
+def get_users_version(db: SessionLocal) -> int:
+    """Returns the change counter of the users table, a primary-key range scan over its shards."""
+    return db.scalar(users_version_statement())
+
+# Columns of the public user representation; read paths select only these, as plain rows
+USER_COLUMNS = (DBUser.id, DBUser.name, DBUser.email)
+
+def users_json(rows) -> bytes:
+    """
+    Serializes (id, name, email) rows into the JSON array of users returned by GET /users.
+    The output is byte for byte what FastAPI's JSONResponse produces from UserResponse models,
+    without building and validating a model per row.
+    """
+    return dumps_json([{"id": user_id, "name": name, "email": email} for user_id, name, email in rows])
 
-def get_user_by_id(db: SessionLocal, user_id: int) -> Optional[UserResponse]:
-    """Searches for and returns a user by their ID."""
-    user = db.query(DBUser).filter(DBUser.id == user_id).first()
+def email_domain_of(email: str) -> str:
+    """Returns the value stored in the email_domain column for an email."""
+    return email.rpartition("@")[2].lower() if "@" in email else ""
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Returns the smallest string greater than every string starting with prefix, if any."""
+    for end in range(len(prefix) - 1, -1, -1):
+        if ord(prefix[end]) < 0x10FFFF:
+            code_point = ord(prefix[end]) + 1
+            # Surrogates cannot be encoded to UTF-8; the next encodable character after U+D7FF is U+E000
+            if 0xD800 <= code_point <= 0xDFFF:
+                code_point = 0xE000
+            return prefix[:end] + chr(code_point)
+    return None
+
+def user_filter_conditions(filters: UserFilters) -> list:
+    """
+    Translates user filters into index-friendly conditions, shared with async_database.
+    The name prefix becomes a range on the (name, id) index; LIKE is kept only to recheck the
+    rows in that range, since SQLite's LIKE is case-insensitive and would not use the index.
+    """
+    conditions = []
+    if filters.name:
+        conditions.append(DBUser.name >= filters.name)
+        upper = prefix_upper_bound(filters.name)
+        if upper is not None:
+            conditions.append(DBUser.name < upper)
+        conditions.append(DBUser.name.startswith(filters.name, autoescape=True))
+    if filters.email is not None:
+        conditions.append(DBUser.email == filters.email)
+    if filters.email_domain is not None:
+        conditions.append(DBUser.email_domain == filters.email_domain.lower())
+    return conditions
+
+def users_statement(filters: UserFilters, after_id: Optional[int] = None, after_name: Optional[str] = None):
+    """
+    Builds the query for a filtered, ordered list of users, shared with async_database.
+    Pages continue after the cursor row: by id, or by (name, id) when sorted by name,
+    so each page is an index seek rather than an OFFSET scan.
+    """
+    statement = select(*USER_COLUMNS).where(*user_filter_conditions(filters))
+    if filters.sort == "name":
+        if after_name is not None:
+            statement = statement.where(tuple_(DBUser.name, DBUser.id) > tuple_(after_name, after_id))
+        return statement.order_by(DBUser.name, DBUser.id)
+    if after_id is not None:
+        statement = statement.where(DBUser.id > after_id)
+    return statement.order_by(DBUser.id)
+
+# Search terms shorter than a trigram cannot be looked up in the search index
+MIN_SEARCH_TERM_LENGTH = 3
+
+def search_users_statement(query: str, limit: int, offset: int):
+    """
+    Builds the query for users whose name or email contains every whitespace-separated term
+    of the search, case-insensitively. On SQLite it is answered by the users_fts index and
+    ranked by BM25, with name matches weighted above email matches; other databases get an
+    unranked scan in ID order. Raises ValueError for terms shorter than MIN_SEARCH_TERM_LENGTH.
+    """
+    terms = query.split()
+    if not terms or any(len(term) < MIN_SEARCH_TERM_LENGTH for term in terms):
+        raise ValueError(f"Search terms must be at least {MIN_SEARCH_TERM_LENGTH} characters long")
+    if IS_SQLITE:
+        # Each term is quoted as an FTS5 string, so user input cannot inject query syntax
+        match = " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        return text(
+            """SELECT rowid AS id, name, email FROM users_fts WHERE users_fts MATCH :match
+            ORDER BY bm25(users_fts, 2.0, 1.0), rowid LIMIT :limit OFFSET :offset"""
+        ).bindparams(match=match, limit=limit, offset=offset)
+    conditions = [
+        or_(DBUser.name.icontains(term, autoescape=True), DBUser.email.icontains(term, autoescape=True))
+        for term in terms
+    ]
+    return select(*USER_COLUMNS).where(*conditions).order_by(DBUser.id).limit(limit).offset(offset)
+
+def search_users_json(db: SessionLocal, query: str, limit: int, offset: int) -> Tuple[bytes, bool]:
+    """
+    Returns one page of search results serialized as JSON, best matches first,
+    and whether more results follow it.
+    """
+    # Fetch one extra row to know whether another page exists
+    rows = db.execute(search_users_statement(query, limit + 1, offset)).all()
+    return users_json(rows[:limit]), len(rows) > limit
+
+def cursor_name_statement(after_id: int):
+    """Builds the lookup of the cursor row's name, which name-sorted pages continue after."""
+    return select(DBUser.name).where(DBUser.id == after_id)
+
+def get_all_users_json(db: SessionLocal, filters: UserFilters) -> bytes:
+    """
+    Returns the complete list of users matching the filters, serialized as JSON.
+    Only the public columns are selected, as Core rows: no ORM instances are built or
+    added to the identity map, and no password hashes are read. A lookup of a single email
+    is answered through the user cache.
+    """
+    if filters.is_email_lookup():
+        user = get_user_by_email(db, filters.email)
+        return users_json([] if user is None else [(user.id, user.name, user.email)])
+    return users_json(db.execute(users_statement(filters)))
+
+def get_users_page_json(db: SessionLocal, filters: UserFilters, after_id: int, limit: int) -> Tuple[bytes, Optional[int]]:
+    """
+    Returns one page of users matching the filters, starting after the given cursor, serialized as JSON.
+    Pages are read with an index seek to the cursor, so each one costs O(log n + limit)
+    no matter how deep the client pages. Also returns the cursor for the next page,
+    or None when this is the last one. Raises ValueError if a name-sorted page starts
+    after a user that does not exist.
+    """
+    after_name = None
+    if filters.sort == "name" and after_id:
+        after_name = db.scalar(cursor_name_statement(after_id))
+        if after_name is None:
+            raise ValueError("after_id does not refer to an existing user")
+    # Fetch one extra row to know whether another page exists
+    rows = db.execute(users_statement(filters, after_id, after_name).limit(limit + 1)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return users_json(rows[:limit]), next_cursor
+
+def iter_user_batches(batch_size: int = 1000, primary: bool = False) -> Iterator[List[UserResponse]]:
+    """
+    Yields every user ordered by ID, in lists of at most batch_size users.
+    Rows are fetched from the cursor in batches instead of loaded all at once, so memory
+    stays constant regardless of table size. Uses its own session because streaming
+    responses keep iterating after the request's dependencies have been closed; it reads
+    from the replica unless primary is set.
+    """
+    db = SessionLocal() if primary else ReplicaSessionLocal()
+    try:
+        result = db.execute(
+            select(*USER_COLUMNS)
+            .order_by(DBUser.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for rows in result.partitions():
+            yield [UserResponse(id=row.id, name=row.name, email=row.email) for row in rows]
+    finally:
+        db.close()
+
+def get_user_by_id(db: SessionLocal, user_id: int) -> Optional[UserRecord]:
+    """Searches for and returns a user by their ID, from the cache when possible."""
+    cached = None if db.info.get("skip_cache") else get_cached_user(user_id)
+    if cached is not None:
+        return cached
+
+    user = db.execute(select(*USER_COLUMNS, DBUser.version).where(DBUser.id == user_id).limit(1)).first()
     if user:
-        return UserResponse(id=user.id, name=user.name, email=user.email)
+        result = UserRecord(id=user.id, name=user.name, email=user.email, version=user.version)
+        cache_user(result)
+        return result
     return None
 
-def get_user_by_email(db: SessionLocal, email: str) -> Optional[UserResponse]:
-    """Searches for and returns a user by their email."""
-    user = db.query(DBUser).filter(DBUser.email == email).first()
+def get_users_by_ids_json(db: SessionLocal, user_ids: List[int]) -> bytes:
+    """
+    Looks up many users with IN queries of up to IN_LOOKUP_CHUNK_SIZE IDs and serializes one
+    result per requested ID, in request order, as the JSON array returned by POST /users/batch-get.
+    IDs without a user get found=false and user=null; repeated IDs get a result at each position.
+    """
+    unique_ids = list(dict.fromkeys(user_ids))
+    users = {}
+    for start in range(0, len(unique_ids), IN_LOOKUP_CHUNK_SIZE):
+        chunk = unique_ids[start:start + IN_LOOKUP_CHUNK_SIZE]
+        for user_id, name, email in db.execute(select(*USER_COLUMNS).where(DBUser.id.in_(chunk))):
+            users[user_id] = {"id": user_id, "name": name, "email": email}
+    return dumps_json([
+        {"id": user_id, "found": user_id in users, "user": users.get(user_id)} for user_id in user_ids
+    ])
+
+def get_user_by_email(db: SessionLocal, email: str) -> Optional[UserRecord]:
+    """Searches for and returns a user by their email, from the cache when possible."""
+    cached = None if db.info.get("skip_cache") else get_cached_user_by_email(email)
+    if cached is not None:
+        return cached
+
+    user = db.execute(select(*USER_COLUMNS, DBUser.version).where(DBUser.email == email).limit(1)).first()
     if user:
-        return UserResponse(id=user.id, name=user.name, email=user.email)
+        result = UserRecord(id=user.id, name=user.name, email=user.email, version=user.version)
+        cache_user(result)
+        return result
     return None
 
+def create_user_statement(user: User, hashed_password: str):
+    """Builds the single INSERT ... RETURNING used to create a user, shared with async_database."""
+    return (
+        insert(DBUser)
+        .values(name=user.name, email=user.email, email_domain=email_domain_of(user.email), hashed_password=hashed_password)
+        .returning(DBUser.id, DBUser.name, DBUser.email)
+    )
+
 def create_new_user(db: SessionLocal, user: User) -> UserResponse:
-    """Creates a new user and adds it to the database."""
-    # In a real app, you'd hash the password
-    fake_hashed_password = user.password + "notreallyhashed"
+    """
+    Creates a new user with a single INSERT ... RETURNING.
+    A duplicate email is rejected by the unique index on email and raised as ValueError,
+    which is also safe against concurrent inserts of the same email.
+    """
+    # Hashing runs on the password hashing process pool while this thread waits
+    hashed_password = password_hasher.hash(user.password)
+    statement = create_user_statement(user, hashed_password)
+    try:
+        row = run_write(db, lambda session: session.execute(statement).one())
+    except IntegrityError:
+        raise ValueError("Email already registered")
     
-    db_user = DBUser(name=user.name, email=user.email, hashed_password=fake_hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # Drop any stale email mapping left behind by a deleted or renamed user
+    invalidate_user(row.id, row.email, version=1)
     
-    return UserResponse(id=db_user.id, name=db_user.name, email=db_user.email)
+    return UserResponse(id=row.id, name=row.name, email=row.email)
+
+def bulk_insert_statement():
+    """
+    Builds the INSERT ... RETURNING used by create_users_bulk. Rows whose email is already
+    registered are skipped by ON CONFLICT DO NOTHING instead of failing the statement, and are
+    missing from the returned rows.
+    """
+    dialect_insert = sqlite_insert if IS_SQLITE else postgresql_insert
+    return (
+        dialect_insert(DBUser)
+        .on_conflict_do_nothing(index_elements=[DBUser.email])
+        .returning(DBUser.id, DBUser.name, DBUser.email)
+    )
+
+def create_users_bulk(db: SessionLocal, users: List[User]) -> List[BulkUserResult]:
+    """
+    Creates many users in a single transaction and returns one result per input user.
+    Email conflicts are checked with IN (...) lookups instead of one query per user, so no
+    password is hashed for a known duplicate, and all new rows are inserted with a single
+    executemany. Users whose email is already registered, repeated earlier in the same
+    request, or registered by a concurrent request while the batch was being hashed, fail
+    individually without aborting the rest.
+    """
+    emails = [user.email for user in users]
+    existing_emails = set()
+    for start in range(0, len(emails), IN_LOOKUP_CHUNK_SIZE):
+        chunk = emails[start:start + IN_LOOKUP_CHUNK_SIZE]
+        existing_emails.update(db.scalars(select(DBUser.email).where(DBUser.email.in_(chunk))))
+    # End the lookup's read transaction; the insert below may commit on the group commit writer
+    db.rollback()
+
+    results: List[Optional[BulkUserResult]] = [None] * len(users)
+    new_indexes = []
+    for index, user in enumerate(users):
+        if user.email in existing_emails:
+            results[index] = BulkUserResult(index=index, success=False, detail="Email already registered")
+        else:
+            # Later duplicates inside the same request are rejected too
+            existing_emails.add(user.email)
+            new_indexes.append(index)
+
+    if new_indexes:
+        # The whole batch is hashed in parallel across the password hashing process pool
+        hashed_passwords = password_hasher.hash_many([users[i].password for i in new_indexes])
+        rows = [
+            {
+                "name": users[i].name,
+                "email": users[i].email,
+                "email_domain": email_domain_of(users[i].email),
+                "hashed_password": hashed_password,
+            }
+            for i, hashed_password in zip(new_indexes, hashed_passwords)
+        ]
+        statement = bulk_insert_statement()
+        created = run_write(db, lambda session: session.execute(statement, rows).all())
+
+        # Emails are unique within rows, so they identify the returned rows
+        created_by_email = {row.email: row for row in created}
+        for index in new_indexes:
+            row = created_by_email.get(users[index].email)
+            if row is None:
+                results[index] = BulkUserResult(index=index, success=False, detail="Email already registered")
+            else:
+                results[index] = BulkUserResult(
+                    index=index, success=True, user=UserResponse(id=row.id, name=row.name, email=row.email)
+                )
+
+    return results
+
+def update_user_statement(user_id: int, user: User, hashed_password: str):
+    """
+    Builds the single UPDATE ... RETURNING used to update a user, shared with async_database.
+    It returns no row when the user does not exist.
+    """
+    return (
+        update(DBUser)
+        .where(DBUser.id == user_id)
+        .values(
+            name=user.name,
+            email=user.email,
+            email_domain=email_domain_of(user.email),
+            hashed_password=hashed_password,
+            version=DBUser.version + 1,
+        )
+        .returning(DBUser.id, DBUser.name, DBUser.email, DBUser.version)
+        .execution_options(synchronize_session=False)
+    )
+
+def delete_user_statement(user_id: int):
+    """Builds the single DELETE ... RETURNING used to delete a user, shared with async_database."""
+    return (
+        delete(DBUser)
+        .where(DBUser.id == user_id)
+        .returning(DBUser.email)
+        .execution_options(synchronize_session=False)
+    )
 
 def update_user(db: SessionLocal, user_id: int, user: User) -> Optional[UserResponse]:
-    """Updates an existing user in the database."""
-    db_user = db.query(DBUser).filter(DBUser.id == user_id).first()
-    if not db_user:
+    """
+    Updates an existing user in the database with a single UPDATE ... RETURNING.
+    An email that belongs to another user is rejected by the unique index on email,
+    so no lookups are needed before the write.
+    """
+    hashed_password = password_hasher.hash(user.password)
+    statement = update_user_statement(user_id, user, hashed_password)
+    try:
+        row = run_write(db, lambda session: session.execute(statement).first())
+    except IntegrityError:
+        raise ValueError("Email already registered")
+    if row is None:
         return None
     
-    # Check if email is being changed and if it already exists
-    if user.email != db_user.email:
-        existing_user = db.query(DBUser).filter(DBUser.email == user.email).first()
-        if existing_user:
-            raise ValueError("Email already registered")
-    
-    # Update user fields
-    db_user.name = user.name
-    db_user.email = user.email
-    # In a real app, you'd hash the password
-    db_user.hashed_password = user.password + "notreallyhashed"
-    
-    db.commit()
-    db.refresh(db_user)
+    # A cached mapping from the previous email is dropped on its next lookup,
+    # since it would point to an entry with a different email
+    invalidate_user(user_id, row.email, version=row.version)
     
-    return UserResponse(id=db_user.id, name=db_user.name, email=db_user.email)
+    return UserResponse(id=row.id, name=row.name, email=row.email)
 
 def delete_user(db: SessionLocal, user_id: int) -> bool:
-    """Deletes a user from the database."""
-    db_user = db.query(DBUser).filter(DBUser.id == user_id).first()
-    if not db_user:
+    """Deletes a user from the database with a single DELETE ... RETURNING."""
+    statement = delete_user_statement(user_id)
+    row = run_write(db, lambda session: session.execute(statement).first())
+    if row is None:
         return False
     
-    db.delete(db_user)
-    db.commit()
+    invalidate_user(user_id, row.email, version=None)
     return True
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""
+Helpers for strong ETags and If-None-Match handling on the user endpoints.
+"""
+
+import hashlib
+from typing import Optional
+
+from models import UserFilters, UserRecord
+
+
+def user_etag(user: UserRecord) -> str:
+    """ETag of a single user, derived from its row version."""
+    return f'"user-{user.id}-v{user.version}"'
+
+
+def users_etag(
+    users_version: int, after_id: Optional[int] = None, limit: Optional[int] = None, filters: Optional[UserFilters] = None
+) -> str:
+    """
+    ETag of the user list, derived from the users table change counter.
+    Pages include their cursor and size, and filtered lists a digest of their filters,
+    so each page and each filtered list has its own ETag.
+    """
+    etag = f"users-v{users_version}"
+    if after_id is not None or limit is not None:
+        etag += f"-after{after_id or 0}-limit{limit}"
+    if filters is not None and not filters.is_default():
+        etag += "-q" + hashlib.sha1(filters.model_dump_json().encode("utf-8")).hexdigest()[:16]
+    return f'"{etag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against an ETag, using weak comparison as RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
@@ -0,0 +1,33 @@
+"""
+JSON serialization for API responses, using orjson when it is installed.
+
+orjson serializes several times faster than the standard library's json module. Its output
+matches what FastAPI's JSONResponse produces for the API's data: compact separators, UTF-8
+without escaping non-ASCII characters. Without orjson, the standard library is used with the
+same settings as JSONResponse, so responses are identical either way.
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    # Optional dependency: pip install orjson
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(content: Any) -> bytes:
+    """Serializes content to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps_json; same content type and body, less CPU per request."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
@@ -4,26 +4,35 @@ Script to initialize the database and create tables.
 """
 
 import os
-from database import Base, engine, DBUser
-from sqlalchemy import text
+from database import Base, engine, DBUser, IS_SQLITE
+from sqlalchemy import inspect, text
 
 def init_database():
     """Initialize the database and create all tables."""
     print("🔧 Initializing database...")
     
-    # Remove existing database if it exists
-    if os.path.exists("test.db"):
-        os.remove("test.db")
-        print("🗑️  Removed existing database")
+    # Close pooled connections so they don't keep writing to a removed file
+    engine.dispose()
+    
+    if IS_SQLITE:
+        # Remove existing database if it exists
+        database_file = engine.url.database
+        if database_file and os.path.exists(database_file):
+            for path in (database_file, f"{database_file}-wal", f"{database_file}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+            print("🗑️  Removed existing database")
+    else:
+        # Other databases are reset in place
+        Base.metadata.drop_all(bind=engine)
+        print("🗑️  Dropped existing tables")
     
     # Create all tables
     Base.metadata.create_all(bind=engine)
     
     # Verify the database was created
-    with engine.connect() as conn:
-        result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table';"))
-        tables = result.fetchall()
-        print(f"✅ Database created with tables: {[table[0] for table in tables]}")
+    tables = inspect(engine).get_table_names()
+    print(f"✅ Database created with tables: {tables}")
     
     # Verify we can write to the database
     try:
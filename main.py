@@ -1,51 +1,222 @@
-from fastapi import FastAPI, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+import hmac
+from typing import List, Optional
+from urllib.parse import urlencode
 from sqlalchemy.orm import Session
 
 # Import models and database functions from separate modules
-from models import User, UserResponse
-from database import get_all_users, get_user_by_id, get_user_by_email, create_new_user, update_user, delete_user, get_db
+from config import (
+    ADMIN_TOKEN, BROTLI_QUALITY, COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_OFFLOAD_SIZE, DB_ASYNC, DEFAULT_PAGE_SIZE,
+    GZIP_LEVEL, MAX_PAGE_SIZE, MAX_QUERIES_PER_REQUEST, PROFILER_MAX_SECONDS, QUERY_PROFILING, REPEATED_QUERY_THRESHOLD,
+    SLOW_QUERY_MS,
+)
+from etags import etag_matches, user_etag, users_etag
+from models import User, UserFilters, UserResponse, BatchGetResult, BulkUserResult
+from cache import user_cache
+from passwords import PasswordHashingBusy, password_hasher
+from fast_json import FastJSONResponse
+from compression import CompressionMiddleware
+from maintenance import database_maintenance
+from metrics import MetricsMiddleware, instrument_engine, metrics_registry
+from profiling import QueryProfilingMiddleware
+from sampling_profiler import ProfilerBusy, sampling_profiler
+from replication import is_write, mark_recent_write, reads_from_primary, replica_enabled
+from database import get_users_version, get_all_users_json, get_users_page_json, search_users_json, iter_user_batches, get_user_by_id, get_users_by_ids_json, create_new_user, create_users_bulk, update_user, delete_user, get_db, get_read_db, optimize_database, sqlite_settings, write_queue, engine, replica_engine
 
-# Create the FastAPI application
-app = FastAPI()
+# Create the FastAPI application; responses are serialized with orjson when it is installed
+app = FastAPI(
+    default_response_class=FastJSONResponse,
+    on_startup=[database_maintenance.start, write_queue.start],
+    on_shutdown=[write_queue.stop, database_maintenance.stop, password_hasher.shutdown, optimize_database],
+)
+
+# Shed load when the password hashing pool is saturated instead of queueing without limit
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request, exc: PasswordHashingBusy):
+    return FastJSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# With a read replica, pin clients that have just written to the primary for their next reads
+async def read_your_writes_middleware(request: Request, call_next):
+    response = await call_next(request)
+    if is_write(request) and response.status_code < 400:
+        mark_recent_write(response)
+    return response
+
+if replica_enabled():
+    app.middleware("http")(read_your_writes_middleware)
+
+# Compress large responses for clients that accept it; wraps only the read-your-writes middleware and the routes,
+# while query profiling and metrics, added after it, wrap compression
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        offload_size=COMPRESSION_OFFLOAD_SIZE,
+        gzip_level=GZIP_LEVEL,
+        brotli_quality=BROTLI_QUALITY,
+    )
+
+# Opt-in query profiling: Server-Timing headers and slow query / N+1 warnings; added after compression, so it
+# wraps compression (its app time includes compressing the first body chunk) and sits inside metrics
+if QUERY_PROFILING:
+    app.add_middleware(
+        QueryProfilingMiddleware,
+        slow_query_ms=SLOW_QUERY_MS,
+        max_queries=MAX_QUERIES_PER_REQUEST,
+        repeated_queries=REPEATED_QUERY_THRESHOLD,
+    )
+
+# Record request and query metrics for GET /metrics; outermost, so latencies include compression
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(replica_engine)
+
+# The CRUD endpoints are declared on a router so that the async handlers in
+# async_routes can be registered in their place when DB_ASYNC is enabled
+router = APIRouter()
+
+# Maximum number of users accepted by a single POST /users/bulk request
+MAX_BULK_SIZE = 10000
+
+# Maximum number of IDs accepted by a single POST /users/batch-get request
+MAX_BATCH_GET_SIZE = 1000
+
+# Results per page of GET /users/search when no limit is given
+DEFAULT_SEARCH_LIMIT = 20
 
 # Endpoint to create a user (POST)
-@app.post("/users", response_model=UserResponse, status_code=201)
+@router.post("/users", response_model=UserResponse, status_code=201)
 def create_user(user: User, db: Session = Depends(get_db)):
     """
-    Creates a new user after checking if the email is already in use.
+    Creates a new user with a single INSERT; an email that is already in use
+    is rejected by the database's unique index.
     """
-    # Check if user with this email already exists
-    db_user = get_user_by_email(db, user.email)
-    if db_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create and return the new user
-    return create_new_user(db, user)
+    try:
+        return create_new_user(db, user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint to create many users at once (POST)
+@app.post("/users/bulk", response_model=List[BulkUserResult])
+def create_users_bulk_endpoint(users: List[User], db: Session = Depends(get_db)):
+    """
+    Creates a batch of users in a single transaction.
+    Returns one result per user, in request order; users whose email is already
+    registered are reported as failed while the rest are still created.
+    """
+    if len(users) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_SIZE} users can be created per request")
+    return create_users_bulk(db, users)
+
+# Endpoint to get many users by their IDs (POST)
+@app.post("/users/batch-get", response_model=List[BatchGetResult])
+def batch_get_users(user_ids: List[int], db: Session = Depends(get_read_db)):
+    """
+    Gets every user in a list of IDs with one query per 500 IDs, instead of one request per user.
+    Returns one result per ID, in request order; IDs without a user have found=false.
+    """
+    if len(user_ids) > MAX_BATCH_GET_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_GET_SIZE} users can be fetched per request")
+    return Response(get_users_by_ids_json(db, user_ids), media_type="application/json")
 
 # Endpoint to get all users (GET)
-@app.get("/users", response_model=List[UserResponse])
-def get_users(db: Session = Depends(get_db)):
+@router.get("/users", response_model=List[UserResponse])
+def get_users(
+    after_id: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    filters: UserFilters = Depends(),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Returns the list of users from the database.
+    Users can be filtered by name prefix, exact email and email domain, and sorted by
+    id (the default) or name; every filter and sort order is served from an index.
+    When after_id or limit is given, returns a single page instead of the complete list,
+    and sets the X-Next-Cursor and Link headers if more users remain.
+    Responses carry an ETag, and If-None-Match requests for an unchanged list get a 304.
+    The body is serialized straight from the database rows; response_model only documents it.
+    """
+    page_size = None if after_id is None and limit is None else limit or DEFAULT_PAGE_SIZE
+
+    # The collection ETag only needs the table change counter, not the rows
+    etag = users_etag(get_users_version(db), after_id, page_size, filters)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {"ETag": etag}
+
+    if page_size is None:
+        return Response(get_all_users_json(db, filters), media_type="application/json", headers=headers)
+
+    try:
+        content, next_cursor = get_users_page_json(db, filters, after_id or 0, page_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+        query = urlencode({**filters.query_params(), "after_id": next_cursor, "limit": page_size})
+        headers["Link"] = f'</users?{query}>; rel="next"'
+    return Response(content, media_type="application/json", headers=headers)
+
+# Endpoint to export all users as NDJSON (GET)
+# Declared before /users/{user_id} so "export" is not parsed as a user ID
+@app.get("/users/export")
+def export_users(request: Request):
+    """
+    Streams every user as newline-delimited JSON, one user per line.
+    Users are read and written out in batches as they arrive from the database.
     """
-    Returns the complete list of users from the database.
+    batches = iter_user_batches(primary=reads_from_primary(request))
+    chunks = ("".join(user.model_dump_json() + "\n" for user in batch) for batch in batches)
+    return StreamingResponse(chunks, media_type="application/x-ndjson")
+
+# Endpoint to search users by name or email (GET)
+# Declared before /users/{user_id} so "search" is not parsed as a user ID
+@app.get("/users/search", response_model=List[UserResponse])
+def search_users(
+    q: str = Query(..., min_length=3, max_length=200),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Returns the users whose name or email contains every term of q (at least 3 characters
+    each, case-insensitive), best matches first. Pages are selected with limit and offset,
+    and the Link header points to the next page if more results remain.
     """
-    return get_all_users(db)
+    try:
+        content, has_more = search_users_json(db, q, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {}
+    if has_more:
+        query = urlencode({"q": q, "limit": limit, "offset": offset + limit})
+        headers["Link"] = f'</users/search?{query}>; rel="next"'
+    return Response(content, media_type="application/json", headers=headers)
 
 # Endpoint to get a user by their ID (GET)
-@app.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+@router.get("/users/{user_id}", response_model=UserResponse)
+def get_user(user_id: int, response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_read_db)):
     """
     Searches for and returns a user by their ID from the database.
+    Responses carry an ETag, and If-None-Match requests for an unchanged user get a 304.
     """
     # Retrieve the user from the database
     db_user = get_user_by_id(db, user_id)
     if db_user is None:
         # If the user is not found, raise an HTTP 404 error
         raise HTTPException(status_code=404, detail="User not found")
+
+    # Answer conditional requests without serializing the body
+    etag = user_etag(db_user)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return db_user
 
 # Endpoint to update a user by their ID (PUT)
-@app.put("/users/{user_id}", response_model=UserResponse)
+@router.put("/users/{user_id}", response_model=UserResponse)
 def update_user_endpoint(user_id: int, user: User, db: Session = Depends(get_db)):
     """
     Updates an existing user in the database.
@@ -59,7 +230,7 @@ def update_user_endpoint(user_id: int, user: User, db: Session = Depends(get_db)
         raise HTTPException(status_code=400, detail=str(e))
 
 # Endpoint to delete a user by their ID (DELETE)
-@app.delete("/users/{user_id}")
+@router.delete("/users/{user_id}")
 def delete_user_endpoint(user_id: int, db: Session = Depends(get_db)):
     """
     Deletes a user from the database.
@@ -68,3 +239,91 @@ def delete_user_endpoint(user_id: int, db: Session = Depends(get_db)):
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted successfully"}
+
+# Endpoint to get the user cache counters (GET)
+@app.get("/stats/cache")
+def get_cache_stats():
+    """
+    Returns hit, miss and eviction counters for the user lookup cache.
+    Hits and misses are counted per process; with the Redis backend the server-wide
+    counters are included too.
+    """
+    return user_cache.stats()
+
+# Endpoint to get the password hashing pool counters (GET)
+@app.get("/stats/hashing")
+def get_hashing_stats():
+    """
+    Returns queue depth and throughput counters for the password hashing process pool.
+    """
+    return password_hasher.stats()
+
+# Endpoint to get the SQLite settings and database maintenance counters (GET)
+@app.get("/stats/database")
+def get_database_stats():
+    """
+    Returns the SQLite profile and pragmas in effect, with the WAL size and the checkpoint
+    and PRAGMA optimize counters of the background maintenance worker.
+    """
+    return {**sqlite_settings(), **database_maintenance.stats()}
+
+# Endpoint to get the group commit counters (GET)
+@app.get("/stats/writes")
+def get_write_stats():
+    """
+    Returns how many writes the group commit queue has committed, in how many batches.
+    """
+    return write_queue.stats()
+
+# Endpoint to get request and database metrics in the Prometheus text format (GET)
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    Returns request counts, in-progress requests, latency histograms and database query
+    counts and times per route template, for Prometheus to scrape.
+    """
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    """
+    Allows a request only with "Authorization: Bearer <ADMIN_TOKEN>".
+    Without ADMIN_TOKEN configured, the admin endpoints answer 404 as if they did not exist.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+# Endpoint to take a CPU profile of this worker process (POST)
+@app.post("/admin/profile", include_in_schema=False, dependencies=[Depends(require_admin)])
+def profile_process(
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    include_idle: bool = False,
+):
+    """
+    Samples the stacks of every thread of the process that handles this request for the given
+    number of seconds, and returns them in the collapsed stack format for flame graph tools.
+    Only one profile runs at a time; a concurrent request gets 409.
+    """
+    try:
+        result = sampling_profiler.profile(seconds, interval_ms / 1000, include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {
+        "X-Profile-Samples": str(result["samples"]),
+        "X-Profile-Overhead": f"{result['overhead']:.4f}",
+        "Content-Disposition": 'attachment; filename="profile.collapsed"',
+    }
+    return Response(result["collapsed"], media_type="text/plain", headers=headers)
+
+# Register the CRUD endpoints, async or sync depending on configuration
+if DB_ASYNC:
+    from async_database import async_engine, async_replica_engine
+    from async_routes import router as async_router
+    instrument_engine(async_engine.sync_engine)
+    instrument_engine(async_replica_engine.sync_engine)
+    app.include_router(async_router)
+else:
+    app.include_router(router)
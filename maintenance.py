@@ -0,0 +1,166 @@
+"""
+Background maintenance of the SQLite database: WAL checkpoints and planner statistics.
+
+SQLite's automatic checkpoints (wal_autocheckpoint) run inside whichever commit crosses the
+threshold, and only in PASSIVE mode, which gives up on pages that a reader still needs. Under
+sustained writes with overlapping readers the WAL then keeps growing, and every read has to
+search a longer WAL. This worker checkpoints on a schedule outside of request handling, and
+truncates the WAL file once it exceeds WAL_TRUNCATE_BYTES.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy.engine import Engine
+
+from config import DB_MAINTENANCE_INTERVAL, DB_OPTIMIZE_INTERVAL, WAL_TRUNCATE_BYTES
+from database import SQLITE_BUSY_TIMEOUT_MS, engine
+
+logger = logging.getLogger(__name__)
+
+# How long a TRUNCATE checkpoint waits for readers of older snapshots. It holds the write lock
+# while it waits, so it gives up quickly and leaves the WAL to the next run instead
+TRUNCATE_BUSY_TIMEOUT_MS = 1000
+
+
+class DatabaseMaintenance:
+    """Runs WAL checkpoints and PRAGMA optimize on a background thread, with timing counters."""
+
+    def __init__(self, engine: Engine, interval: float, truncate_bytes: int, optimize_interval: float):
+        self.engine = engine
+        self.interval = interval
+        self.truncate_bytes = truncate_bytes
+        self.optimize_interval = optimize_interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._last_optimize = time.monotonic()
+        self.checkpoints = 0
+        self.truncate_checkpoints = 0
+        self.busy_checkpoints = 0
+        self.last_checkpoint: Dict[str, Any] = {}
+        self.max_checkpoint_seconds = 0.0
+        self.optimize_runs = 0
+        self.last_optimize_seconds = 0.0
+        self.errors = 0
+
+    @property
+    def wal_path(self) -> Optional[str]:
+        """Path of the WAL file, or None for databases that have none."""
+        database = self.engine.url.database
+        if self.engine.dialect.name != "sqlite" or database in (None, "", ":memory:"):
+            return None
+        return database + "-wal"
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 and self.wal_path is not None
+
+    def wal_bytes(self) -> int:
+        """Current size of the WAL file."""
+        try:
+            return os.path.getsize(self.wal_path)
+        except OSError:
+            return 0
+
+    def checkpoint(self, mode: str = "PASSIVE") -> Dict[str, Any]:
+        """
+        Runs a PASSIVE or TRUNCATE checkpoint and returns its outcome.
+        PASSIVE copies what it can without waiting for anyone; TRUNCATE also waits briefly for
+        readers so it can reset the WAL file to zero bytes.
+        """
+        wal_bytes_before = self.wal_bytes()
+        started = time.perf_counter()
+        with self.engine.connect() as connection:
+            if mode == "TRUNCATE":
+                connection.exec_driver_sql(f"PRAGMA busy_timeout={TRUNCATE_BUSY_TIMEOUT_MS}")
+            try:
+                busy, wal_frames, checkpointed_frames = connection.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").one()
+            finally:
+                if mode == "TRUNCATE":
+                    connection.exec_driver_sql(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        seconds = time.perf_counter() - started
+
+        result = {
+            "mode": mode,
+            "busy": bool(busy),
+            "wal_frames": wal_frames,
+            "checkpointed_frames": checkpointed_frames,
+            "wal_bytes_before": wal_bytes_before,
+            "wal_bytes_after": self.wal_bytes(),
+            "seconds": seconds,
+        }
+        with self._lock:
+            self.checkpoints += 1
+            self.truncate_checkpoints += mode == "TRUNCATE"
+            self.busy_checkpoints += bool(busy)
+            self.max_checkpoint_seconds = max(self.max_checkpoint_seconds, seconds)
+            self.last_checkpoint = result
+        return result
+
+    def optimize(self):
+        """Runs PRAGMA optimize, which re-analyzes the tables whose statistics are out of date."""
+        started = time.perf_counter()
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA optimize")
+        with self._lock:
+            self.optimize_runs += 1
+            self.last_optimize_seconds = time.perf_counter() - started
+            self._last_optimize = time.monotonic()
+
+    def run_once(self):
+        """One maintenance pass: a checkpoint, then PRAGMA optimize when it is due."""
+        self.checkpoint("TRUNCATE" if self.wal_bytes() >= self.truncate_bytes else "PASSIVE")
+        if time.monotonic() - self._last_optimize >= self.optimize_interval:
+            self.optimize()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                logger.exception("Database maintenance failed")
+
+    def start(self):
+        """Starts the background thread, when maintenance applies to the configured database."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="database-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, waiting for a running pass to finish."""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the WAL size and checkpoint counters."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "running": self._thread is not None,
+                "interval": self.interval,
+                "wal_bytes": self.wal_bytes() if self.wal_path else 0,
+                "wal_truncate_bytes": self.truncate_bytes,
+                "checkpoints": self.checkpoints,
+                "truncate_checkpoints": self.truncate_checkpoints,
+                "busy_checkpoints": self.busy_checkpoints,
+                "max_checkpoint_seconds": self.max_checkpoint_seconds,
+                "last_checkpoint": self.last_checkpoint,
+                "optimize_runs": self.optimize_runs,
+                "last_optimize_seconds": self.last_optimize_seconds,
+                "errors": self.errors,
+            }
+
+
+database_maintenance = DatabaseMaintenance(
+    engine, interval=DB_MAINTENANCE_INTERVAL, truncate_bytes=WAL_TRUNCATE_BYTES, optimize_interval=DB_OPTIMIZE_INTERVAL
+)
@@ -0,0 +1,243 @@
+"""
+Request and database metrics in the Prometheus text format, served on GET /metrics.
+
+MetricsMiddleware times every request and records it under its route template (the path of the
+matched route, such as /users/{user_id}), so user IDs never become label values; requests that
+match no route share the "unmatched" label. SQLAlchemy cursor events on the API's engines count
+the queries each request runs and the time spent in them, attributed to the request through a
+context variable, which also reaches the threadpool workers running the sync handlers.
+
+Recording costs a few dictionary lookups and one lock acquisition per request and per query, and
+needs no third-party client library. Every uvicorn worker process keeps its own metrics.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestStats:
+    """
+    Database work of the request being handled; the engine events add to it. profile is a
+    profiling.QueryProfile when query profiling is enabled, and None otherwise.
+    """
+
+    __slots__ = ("db_queries", "db_seconds", "profile")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.profile = None
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    """Cumulative-on-export histogram: observe() only increments one bucket."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bound, plus +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _RouteMetrics:
+    __slots__ = ("statuses", "latency", "queries", "db_queries", "db_seconds")
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+
+class MetricsRegistry:
+    """Per-route request and database metrics of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+        self.in_progress = 0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def request_started(self):
+        with self._lock:
+            self.in_progress += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            self.in_progress -= 1
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = _RouteMetrics()
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(stats.db_queries)
+            metrics.db_queries += stats.db_queries
+            metrics.db_seconds += stats.db_seconds
+
+    def query_finished(self, seconds: float):
+        """Counts a query that ran outside of any request, such as background maintenance."""
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            snapshot = [
+                (method, route, dict(m.statuses), list(m.latency.counts), m.latency.sum,
+                 list(m.queries.counts), m.queries.sum, m.db_queries, m.db_seconds)
+                for (method, route), m in routes
+            ]
+            in_progress, background_queries, background_seconds = self.in_progress, self.db_queries, self.db_seconds
+
+        lines: List[str] = []
+        lines += [
+            "# HELP http_requests_total Requests handled, by method, route template and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for method, route, statuses, *_ in snapshot:
+            for status, count in sorted(statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_requests_in_progress Requests being handled by this process.",
+            "# TYPE http_requests_in_progress gauge",
+            f"http_requests_in_progress {in_progress}",
+        ]
+
+        lines += [
+            "# HELP http_request_duration_seconds Time to handle a request, by method and route template.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for method, route, _, counts, total, *_ in snapshot:
+            lines += _histogram_lines("http_request_duration_seconds", method, route, LATENCY_BUCKETS, counts, total)
+
+        lines += [
+            "# HELP http_request_db_queries Database queries run by a request, by method and route template.",
+            "# TYPE http_request_db_queries histogram",
+        ]
+        for method, route, _, _, _, counts, total, *_ in snapshot:
+            lines += _histogram_lines("http_request_db_queries", method, route, QUERY_COUNT_BUCKETS, counts, total)
+
+        lines += [
+            "# HELP db_queries_total Database queries, by the method and route template of the request that ran them.",
+            "# TYPE db_queries_total counter",
+        ]
+        for method, route, *_, db_queries, _ in snapshot:
+            lines.append(f'db_queries_total{{method="{method}",route="{_escape(route)}"}} {db_queries}')
+        lines.append(f'db_queries_total{{method="",route="background"}} {background_queries}')
+
+        lines += [
+            "# HELP db_query_duration_seconds_total Time spent in database queries, by method and route template.",
+            "# TYPE db_query_duration_seconds_total counter",
+        ]
+        for method, route, *_, db_seconds in snapshot:
+            lines.append(f'db_query_duration_seconds_total{{method="{method}",route="{_escape(route)}"}} {db_seconds:.6f}')
+        lines.append(f'db_query_duration_seconds_total{{method="",route="background"}} {background_seconds:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name: str, method: str, route: str, bounds, counts: List[int], total: float) -> List[str]:
+    labels = f'method="{method}",route="{_escape(route)}"'
+    lines = []
+    cumulative = 0
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    cumulative += counts[-1]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {total}")
+    lines.append(f"{name}_count{{{labels}}} {cumulative}")
+    return lines
+
+
+metrics_registry = MetricsRegistry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    stats = current_request.get()
+    if stats is None:
+        metrics_registry.query_finished(seconds)
+    else:
+        stats.db_queries += 1
+        stats.db_seconds += seconds
+        if stats.profile is not None:
+            stats.profile.record(statement, seconds)
+
+
+def instrument_engine(engine: Engine):
+    """Counts and times the queries of an engine (the sync_engine of an AsyncEngine)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records the count, latency and database work of each HTTP request."""
+
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry = metrics_registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.registry.request_started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            current_request.reset(token)
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            self.registry.request_finished(
+                scope["method"], route.path if route is not None else UNMATCHED_ROUTE, status, seconds, stats
+            )
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Dict, Literal, Optional
 
 # Pydantic data model for incoming user data
 # FastAPI uses this to validate the data from POST requests.
@@ -12,3 +13,43 @@ class UserResponse(BaseModel):
     id: int
     name: str
     email: str
+
+
+# User as stored, including the row version used for ETags.
+# Endpoints declare response_model=UserResponse, so the version is never serialized.
+class UserRecord(UserResponse):
+    version: int
+
+# Result for one item of a bulk user creation, in the same position as the request item
+class BulkUserResult(BaseModel):
+    index: int
+    success: bool
+    user: Optional[UserResponse] = None
+    detail: Optional[str] = None
+
+# Result for one requested ID of a batch lookup, in the same position as the request item.
+# user is null when found is false.
+class BatchGetResult(BaseModel):
+    id: int
+    found: bool
+    user: Optional[UserResponse] = None
+
+# Filters and sort order of GET /users, read from the query string.
+# name matches a prefix, email matches exactly, email_domain is case-insensitive.
+class UserFilters(BaseModel):
+    name: Optional[str] = None
+    email: Optional[str] = None
+    email_domain: Optional[str] = None
+    sort: Literal["id", "name"] = "id"
+
+    def is_default(self) -> bool:
+        """Whether no filter and the default order are requested, i.e. the plain user list."""
+        return not self.name and self.email is None and self.email_domain is None and self.sort == "id"
+
+    def is_email_lookup(self) -> bool:
+        """Whether only an exact email is filtered on, which matches at most one user."""
+        return self.email is not None and not self.name and self.email_domain is None
+
+    def query_params(self) -> Dict[str, str]:
+        """The filters as query parameters, omitting unset ones; used to build next-page links."""
+        return self.model_dump(exclude_none=True, exclude_defaults=True)
@@ -0,0 +1,209 @@
+"""
+Password hashing with scrypt, run on a dedicated process pool.
+
+Each hash costs tens of milliseconds of CPU, so it never runs on the event loop or holds
+the GIL of the API process: calls are handed to worker processes, which lets hashing use
+every core. The number of hashes waiting or running is bounded; once the bound is reached,
+new requests are rejected with PasswordHashingBusy instead of queueing without limit.
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_WORKERS, SCRYPT_N, SCRYPT_P, SCRYPT_R
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+# Passwords per bulk chunk: small enough that single hashes queued behind a chunk wait briefly
+BULK_CHUNK_SIZE = 16
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when too many hashes are already waiting for the process pool."""
+
+
+def _scrypt_maxmem(n: int, r: int, p: int) -> int:
+    # hashlib's default limit of 32 MiB is too low for larger cost parameters
+    return 128 * r * (n + p + 2) + 1024 * 1024
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=_scrypt_maxmem(n, r, p), dklen=KEY_BYTES
+    )
+
+
+def hash_password_sync(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    """
+    Hashes a password in the calling process and returns it encoded as
+    scrypt$n$r$p$salt$key. Runs inside the pool workers.
+    """
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return f"scrypt${n}${r}${p}${salt.hex()}${key.hex()}"
+
+
+def hash_passwords_sync(passwords: List[str]) -> List[str]:
+    """Hashes a chunk of passwords in the calling process. Runs inside the pool workers."""
+    return [hash_password_sync(password) for password in passwords]
+
+
+class PasswordHasher:
+    """Hashes passwords on a lazily started process pool with a bounded number of pending hashes."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.total_seconds = 0.0
+        # Bulk hashing keeps at most this many chunks in the pool, leaving the other workers to single hashes
+        self.bulk_slots = max(1, workers // 2)
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_slots)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn instead of fork: the API process runs threads that fork would copy mid-state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """Drops a pool that a dead worker process has left unusable, so the next call starts a new one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_chunk(self, passwords: List[str]) -> Tuple[ProcessPoolExecutor, Future]:
+        """
+        Submits a chunk of passwords to the pool and returns the pool used with the future of the
+        hashes. A pool is broken for good once one of its workers dies (killed by the OOM killer,
+        say), so it is replaced and the chunk resubmitted.
+        """
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(hash_passwords_sync, passwords)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(hash_passwords_sync, passwords)
+
+    def _submit_bulk_chunk(self, passwords: List[str]) -> Tuple[ProcessPoolExecutor, Future]:
+        """Submits a chunk of a bulk once a bulk slot is free; the slot is released when it is done."""
+        self._bulk_slots.acquire()
+        try:
+            executor, future = self._submit_chunk(passwords)
+        except BaseException:
+            self._bulk_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._bulk_slots.release())
+        return executor, future
+
+    def _admit(self) -> float:
+        """Counts a new pending job, or raises PasswordHashingBusy when the queue is full."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHashingBusy("Password hashing queue is full, try again later")
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        return time.perf_counter()
+
+    def _finish(self, started: float):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+
+    def hash(self, password: str) -> str:
+        """Hashes a password, blocking the calling thread (not the event loop) until it is done."""
+        started = self._admit()
+        try:
+            executor, future = self._submit_chunk([password])
+            try:
+                return future.result()[0]
+            except BrokenProcessPool:
+                # A worker died while this hash was queued or running: retry once on a new pool
+                self._discard_executor(executor)
+                return self._submit_chunk([password])[1].result()[0]
+        finally:
+            self._finish(started)
+
+    async def hash_async(self, password: str) -> str:
+        """Hashes a password without blocking the event loop."""
+        started = self._admit()
+        try:
+            executor, future = self._submit_chunk([password])
+            try:
+                return (await asyncio.wrap_future(future))[0]
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                return (await asyncio.wrap_future(self._submit_chunk([password])[1]))[0]
+        finally:
+            self._finish(started)
+
+    def hash_many(self, passwords: List[str]) -> List[str]:
+        """
+        Hashes a batch of passwords in parallel, blocking the calling thread; the batch counts as
+        one pending job. Chunks are handed to the pool only as bulk slots free up, so single hashes
+        submitted meanwhile are queued behind a few short chunks rather than the whole batch.
+        """
+        if not passwords:
+            return []
+        started = self._admit()
+        try:
+            chunksize = min(BULK_CHUNK_SIZE, -(-len(passwords) // self.bulk_slots))
+            chunks = [passwords[start:start + chunksize] for start in range(0, len(passwords), chunksize)]
+            submitted = [self._submit_bulk_chunk(chunk) for chunk in chunks]
+            hashes = []
+            for chunk, (executor, future) in zip(chunks, submitted):
+                try:
+                    hashes.extend(future.result())
+                except BrokenProcessPool:
+                    # Chunks lost with a dead worker are retried once on a new pool
+                    self._discard_executor(executor)
+                    hashes.extend(self._submit_bulk_chunk(chunk)[1].result())
+            return hashes
+        finally:
+            self._finish(started)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns queue depth and throughput counters."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "max_pending_seen": self.max_pending_seen,
+                "bulk_slots": self.bulk_slots,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+                "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        """Stops the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING)
@@ -0,0 +1,154 @@
+"""
+Opt-in per-request query profiling (QUERY_PROFILING=1): Server-Timing, slow queries and N+1 detection.
+
+QueryProfilingMiddleware attaches a QueryProfile to the request's metrics.RequestStats, and the
+cursor event hooks in metrics.py record every statement the request runs into it. The response
+then carries a Server-Timing header with the query count and database time, and the slowest
+statements, which browser developer tools and test scripts can read. The profiling logger warns
+about single queries slower than the slow query threshold, requests that run more queries than
+allowed, and statements repeated within one request, the usual sign of a lookup made per item
+of a list instead of once for the whole list (N+1).
+
+Statements are compared by their SQL text, which SQLAlchemy renders with bound parameters, so the
+same lookup with different values counts as one statement. Parameters are never logged.
+Writes committed by the group commit queue run on its writer thread and are not profiled.
+"""
+
+import logging
+import re
+import time
+from typing import Dict, List, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import RequestStats, UNMATCHED_ROUTE, current_request
+
+logger = logging.getLogger(__name__)
+
+# Longest statement text shown in Server-Timing descriptions and log messages
+STATEMENT_PREVIEW_LENGTH = 120
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_preview(statement: str) -> str:
+    """The statement on one line, truncated for headers and logs."""
+    preview = _WHITESPACE.sub(" ", statement).strip()
+    if len(preview) > STATEMENT_PREVIEW_LENGTH:
+        preview = preview[:STATEMENT_PREVIEW_LENGTH - 3] + "..."
+    return preview
+
+
+def request_label(scope: Scope) -> str:
+    """Method and route template of a request, e.g. "GET /users/{user_id}"."""
+    route = scope.get("route")
+    return f"{scope['method']} {route.path if route is not None else UNMATCHED_ROUTE}"
+
+
+class QueryProfile:
+    """Statements run by one request, with their count, total and slowest time."""
+
+    __slots__ = ("scope", "slow_query_seconds", "statements")
+
+    def __init__(self, scope: Scope, slow_query_seconds: float):
+        self.scope = scope
+        self.slow_query_seconds = slow_query_seconds
+        # statement -> [count, total seconds, slowest seconds]
+        self.statements: Dict[str, List] = {}
+
+    def record(self, statement: str, seconds: float):
+        """Called by the cursor event hooks after each query of the request."""
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+        if seconds >= self.slow_query_seconds:
+            logger.warning(
+                "Slow query in %s (%.1f ms): %s", request_label(self.scope), seconds * 1000, statement_preview(statement)
+            )
+
+    def slowest(self, limit: int) -> List[Tuple[str, float]]:
+        """The statements with the slowest single run, slowest first."""
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][2], reverse=True)
+        return [(statement, slowest) for statement, (_, _, slowest) in ranked[:limit]]
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """The statements run at least threshold times."""
+        return [(statement, count) for statement, (count, _, _) in self.statements.items() if count >= threshold]
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class QueryProfilingMiddleware:
+    """ASGI middleware that profiles the queries of each request and reports them."""
+
+    def __init__(
+        self, app: ASGIApp, slow_query_ms: float, max_queries: int, repeated_queries: int, timing_statements: int = 3
+    ):
+        self.app = app
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.max_queries = max_queries
+        self.repeated_queries = repeated_queries
+        self.timing_statements = timing_statements
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # MetricsMiddleware normally has set up the request's stats already
+        stats = current_request.get()
+        token = None
+        if stats is None:
+            stats = RequestStats()
+            token = current_request.set(stats)
+        profile = stats.profile = QueryProfile(scope, self.slow_query_seconds)
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=list(message["headers"]))
+                headers.append("Server-Timing", self.server_timing(stats, profile, time.perf_counter() - started))
+                message = {**message, "headers": headers.raw}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                current_request.reset(token)
+            self.report(stats, profile)
+
+    def server_timing(self, stats: RequestStats, profile: QueryProfile, seconds: float) -> str:
+        """
+        Server-Timing value with the database time and query count so far, the time to the first
+        response byte, and the slowest statements as db-1, db-2, ...
+        """
+        queries = f"{stats.db_queries} {'query' if stats.db_queries == 1 else 'queries'}"
+        entries = [
+            f"db;dur={stats.db_seconds * 1000:.2f};desc={_quote(queries)}",
+            f"app;dur={seconds * 1000:.2f}",
+        ]
+        for rank, (statement, slowest) in enumerate(profile.slowest(self.timing_statements), start=1):
+            entries.append(f"db-{rank};dur={slowest * 1000:.2f};desc={_quote(statement_preview(statement))}")
+        return ", ".join(entries)
+
+    def report(self, stats: RequestStats, profile: QueryProfile):
+        """Logs requests over the query budget and statements repeated within the request."""
+        if stats.db_queries > self.max_queries:
+            logger.warning(
+                "%s ran %d queries (%.1f ms), more than the %d allowed; slowest: %s",
+                request_label(profile.scope), stats.db_queries, stats.db_seconds * 1000, self.max_queries,
+                "; ".join(statement_preview(statement) for statement, _ in profile.slowest(self.timing_statements)),
+            )
+        for statement, count in profile.repeated(self.repeated_queries):
+            logger.warning(
+                "Possible N+1 in %s: the same statement ran %d times: %s",
+                request_label(profile.scope), count, statement_preview(statement),
+            )
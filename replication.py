@@ -0,0 +1,55 @@
+"""
+Read-your-writes stickiness for read replica routing.
+
+After a successful write, the client gets a cookie holding the time until which its reads
+must go to the primary. Replicas can lag behind the primary, so without it a client could
+create or update a user and not see the change on its next GET.
+"""
+
+import math
+import time
+
+from fastapi import Request, Response
+
+from config import DATABASE_REPLICA_URL, READ_YOUR_WRITES_SECONDS
+
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# Methods that do not write; every other method marks the client as sticky
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Routes that only read despite an unsafe method (a POST body carries the request)
+READ_ONLY_ROUTES = frozenset({("POST", "/users/batch-get")})
+
+
+def replica_enabled() -> bool:
+    """Whether a read replica is configured."""
+    return bool(DATABASE_REPLICA_URL)
+
+
+def is_write(request: Request) -> bool:
+    """Whether a request may write, so that a successful one pins the client to the primary."""
+    return request.method not in SAFE_METHODS and (request.method, request.url.path) not in READ_ONLY_ROUTES
+
+
+def mark_recent_write(response: Response):
+    """Sends the client to the primary for its reads during the next READ_YOUR_WRITES_SECONDS."""
+    until = time.time() + READ_YOUR_WRITES_SECONDS
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        f"{until:.3f}",
+        max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+        httponly=True,
+        samesite="lax",
+    )
+
+
+def reads_from_primary(request: Request) -> bool:
+    """Whether this client wrote recently enough that its reads must skip the replica."""
+    value = request.cookies.get(READ_PRIMARY_COOKIE)
+    if value is None:
+        return False
+    try:
+        return float(value) > time.time()
+    except ValueError:
+        return False
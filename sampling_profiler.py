@@ -0,0 +1,105 @@
+"""
+On-demand sampling CPU profiler for a running API process, served on POST /admin/profile.
+
+While a profile runs, the stack of every thread of the process (the event loop, the threadpool
+workers running the sync handlers, and the background threads) is read with sys._current_frames
+every interval, and identical stacks are counted. The result is in the collapsed stack format,
+one "thread;outer frame;...;inner frame count" line per distinct stack, which flamegraph.pl,
+speedscope and similar tools turn into a flame graph.
+
+Nothing runs and nothing is hooked while no profile is being taken, so the profiler costs
+nothing when it is off. Sampling reads stacks from Python, so time spent in C code shows up in
+the Python frame that called it; threads that are only waiting (on a lock, a queue or the
+event loop's selector) are left out unless include_idle is set.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Dict, Optional
+
+# Innermost frames that mean a thread is blocked rather than running: (file name, function)
+IDLE_FRAMES = frozenset({
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    # With uvloop the event loop waits in C, under asyncio's Runner.run
+    ("runners.py", "run"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_poll"),
+    ("connection.py", "wait"),
+})
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    # Library frames by their path inside site-packages, the API's own frames by file name
+    _, site_packages, inside = path.rpartition("site-packages" + os.sep)
+    name = inside if site_packages else os.path.basename(path)
+    # Semicolons separate frames in the collapsed format
+    return f"{code.co_name} ({name}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _is_idle(frame: FrameType) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads of the process, one profile at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float, include_idle: bool = False) -> Dict[str, object]:
+        """
+        Samples every thread except the calling one for the given number of seconds, and returns
+        the collapsed stacks, the number of samples taken and the sampling overhead.
+        Raises ProfilerBusy if a profile is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            stacks: Counter = Counter()
+            own_thread = threading.get_ident()
+            samples = 0
+            sampling_seconds = 0.0
+            deadline = time.perf_counter() + seconds
+            next_sample = time.perf_counter()
+            while next_sample < deadline:
+                started = time.perf_counter()
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread or (not include_idle and _is_idle(frame)):
+                        continue
+                    labels = []
+                    current: Optional[FrameType] = frame
+                    while current is not None:
+                        labels.append(_frame_label(current))
+                        current = current.f_back
+                    labels.append(thread_names.get(thread_id, f"thread-{thread_id}").replace(";", ":"))
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                sampling_seconds += time.perf_counter() - started
+                next_sample += interval
+                time.sleep(max(next_sample - time.perf_counter(), 0))
+        finally:
+            self._lock.release()
+
+        return {
+            "collapsed": "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+            "samples": samples,
+            # Share of the profiled time spent walking stacks, which holds the GIL
+            "overhead": sampling_seconds / seconds if seconds else 0.0,
+        }
+
+
+sampling_profiler = SamplingProfiler()
@@ -6,9 +6,11 @@ Includes data cleanup and better test isolation.
 
 import requests
 import json
+import re
 import sys
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List
 
 class APITesterEnhanced:
@@ -76,6 +78,15 @@ class APITesterEnhanced:
         self.log_test(f"{test_name} - Required Fields", passed, message)
         return passed
     
+    def retry_busy(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends a request, retrying while the server sheds load with 503 (password hashing queue full)."""
+        for _ in range(50):
+            response = requests.request(method, url, **kwargs)
+            if response.status_code != 503:
+                return response
+            time.sleep(0.05)
+        return response
+    
     def get_all_users(self) -> List[Dict]:
         """Gets all current users."""
         try:
@@ -237,6 +248,76 @@ class APITesterEnhanced:
         except requests.exceptions.RequestException as e:
             self.log_test("POST /users (duplicate) - Connection", False, f"Request failed: {e}")
     
+    def test_concurrent_duplicate_create(self):
+        """Test: Concurrent POSTs with the same email create one user; the others get 400, not 500."""
+        print("\n🧪 Testing POST /users (concurrent duplicate email)")
+
+        email = self.generate_unique_email("race")
+        user = {'name': 'Race User', 'email': email, 'password': 'racepass'}
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                responses = list(pool.map(lambda _: self.retry_busy('POST', f"{self.base_url}/users", json=user), range(8)))
+            codes = sorted(response.status_code for response in responses)
+            passed = codes == [201] + [400] * 7
+            self.log_test("POST /users (concurrent duplicate) - One 201, the rest 400", passed,
+                         "" if passed else f"Got status codes {codes}")
+            created = [response.json() for response in responses if response.status_code == 201]
+            self.created_users.extend(created)
+            details = {response.json().get('detail') for response in responses if response.status_code == 400}
+            passed = details == {"Email already registered"}
+            self.log_test("POST /users (concurrent duplicate) - Error message", passed,
+                         "" if passed else f"Got {details}")
+            lookup = requests.get(f"{self.base_url}/users", params={'email': email}).json()
+            passed = len(lookup) == 1
+            self.log_test("POST /users (concurrent duplicate) - One user stored", passed,
+                         "" if passed else f"Got {lookup}")
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("POST /users (concurrent duplicate) - Connection", False, f"Request failed: {e}")
+
+    def test_update_duplicate_email(self):
+        """Test: PUT with an email taken by another user gets 400, also when updates race."""
+        print("\n🧪 Testing PUT /users/{id} (duplicate email)")
+
+        try:
+            users = []
+            for i in range(3):
+                response = requests.post(f"{self.base_url}/users", json={
+                    'name': f'Update Race {i}', 'email': self.generate_unique_email("update"), 'password': 'racepass'
+                })
+                if not self.assert_status_code(response, 201, "PUT /users (duplicate) - Create user"):
+                    return
+                users.append(response.json())
+            self.created_users.extend(users)
+
+            response = requests.put(f"{self.base_url}/users/{users[1]['id']}", json={
+                'name': 'Update Race 1', 'email': users[0]['email'], 'password': 'racepass'
+            })
+            self.assert_status_code(response, 400, "PUT /users (duplicate)")
+            if response.status_code == 400:
+                detail = response.json().get('detail', '')
+                passed = detail == "Email already registered"
+                self.log_test("PUT /users (duplicate) - Error message", passed,
+                             "" if passed else f"Got '{detail}'")
+
+            # Two users race to take the same free email: one update wins
+            email = self.generate_unique_email("update_target")
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                responses = list(pool.map(lambda user: self.retry_busy('PUT', f"{self.base_url}/users/{user['id']}", json={
+                    'name': user['name'], 'email': email, 'password': 'racepass'
+                }), users[1:]))
+            codes = sorted(response.status_code for response in responses)
+            passed = codes == [200, 400]
+            self.log_test("PUT /users (concurrent duplicate) - One 200, one 400", passed,
+                         "" if passed else f"Got status codes {codes}")
+            lookup = requests.get(f"{self.base_url}/users", params={'email': email}).json()
+            passed = len(lookup) == 1
+            self.log_test("PUT /users (concurrent duplicate) - One user has the email", passed,
+                         "" if passed else f"Got {lookup}")
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("PUT /users (duplicate) - Connection", False, f"Request failed: {e}")
+
     def test_get_user_by_id(self, user_id: int):
         """Test: Get user by ID."""
         print(f"\n🧪 Testing GET /users/{user_id}")
@@ -329,6 +410,618 @@ class APITesterEnhanced:
         except requests.exceptions.RequestException as e:
             self.log_test("Data Persistence - Connection", False, f"Request failed: {e}")
     
+    def test_pagination(self):
+        """Test: Page through users with the after_id/limit cursor."""
+        print("\n🧪 Testing GET /users (cursor pagination)")
+        
+        # Make sure there are at least three users to page through
+        for _ in range(3):
+            requests.post(
+                f"{self.base_url}/users",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps({
+                    'name': 'Pagination Test User',
+                    'email': self.generate_unique_email("page"),
+                    'password': 'testpass'
+                })
+            )
+        
+        try:
+            all_ids = [u['id'] for u in self.get_all_users()]
+            
+            # Walk the pages two users at a time following X-Next-Cursor
+            paged_ids = []
+            params = {'limit': 2}
+            while True:
+                response = requests.get(f"{self.base_url}/users", params=params)
+                if response.status_code != 200:
+                    self.assert_status_code(response, 200, "GET /users?limit=2")
+                    return
+                page = response.json()
+                if len(page) > 2:
+                    self.log_test("Pagination - Page size", False, f"Expected at most 2 users, got {len(page)}")
+                    return
+                paged_ids.extend(u['id'] for u in page)
+                next_cursor = response.headers.get('X-Next-Cursor')
+                if next_cursor is None:
+                    break
+                params = {'limit': 2, 'after_id': next_cursor}
+            
+            passed = paged_ids == sorted(all_ids)
+            self.log_test("Pagination - Pages cover all users in ID order", passed,
+                         f"Expected {sorted(all_ids)}, got {paged_ids}")
+            
+            # An invalid limit should be rejected
+            response = requests.get(f"{self.base_url}/users", params={'limit': 0})
+            self.assert_status_code(response, 422, "GET /users?limit=0")
+            
+        except requests.exceptions.RequestException as e:
+            self.log_test("Pagination - Connection", False, f"Request failed: {e}")
+    
+    def test_filters(self):
+        """Test: Filter GET /users by name prefix, email and email domain, and sort by name."""
+        print("\n🧪 Testing GET /users (filters and sort)")
+        
+        # Names and a domain unique to this run, so earlier runs do not match the filters
+        token = str(uuid.uuid4())[:8]
+        domain = f"filter-{token}.example.com"
+        created = []
+        for suffix in ('b', 'a', 'c'):
+            response = requests.post(
+                f"{self.base_url}/users",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps({
+                    'name': f"Filter {token} {suffix}",
+                    'email': f"filter_{suffix}_{token}@{domain}",
+                    'password': 'testpass'
+                })
+            )
+            if response.status_code == 201:
+                created.append(response.json())
+        
+        try:
+            response = requests.get(f"{self.base_url}/users", params={'name': f"Filter {token}", 'sort': 'name'})
+            self.assert_status_code(response, 200, "GET /users?name=...&sort=name")
+            names = [u['name'] for u in response.json()]
+            expected = [f"Filter {token} {suffix}" for suffix in ('a', 'b', 'c')]
+            self.log_test("Filters - Name prefix sorted by name", names == expected,
+                         f"Expected {expected}, got {names}")
+            
+            # Domains are matched case-insensitively
+            response = requests.get(f"{self.base_url}/users", params={'email_domain': domain.upper()})
+            ids = [u['id'] for u in response.json()]
+            expected_ids = sorted(u['id'] for u in created)
+            self.log_test("Filters - Email domain", ids == expected_ids,
+                         f"Expected {expected_ids}, got {ids}")
+            
+            if created:
+                response = requests.get(f"{self.base_url}/users", params={'email': created[0]['email']})
+                self.log_test("Filters - Exact email", response.json() == [created[0]],
+                             f"Expected [{created[0]}], got {response.json()}")
+            
+            # Name-sorted pages continue after the cursor user
+            response = requests.get(f"{self.base_url}/users",
+                                    params={'name': f"Filter {token}", 'sort': 'name', 'limit': 2})
+            next_cursor = response.headers.get('X-Next-Cursor')
+            page = requests.get(f"{self.base_url}/users", params={
+                'name': f"Filter {token}", 'sort': 'name', 'limit': 2, 'after_id': next_cursor
+            }).json() if next_cursor else []
+            names = [u['name'] for u in response.json() + page]
+            self.log_test("Filters - Name-sorted pages", names == expected,
+                         f"Expected {expected}, got {names}")
+            
+            # A prefix ending in U+D7FF: its range bound must skip the surrogates to U+E000
+            prefix = f"Boundary {token} \ud7ff"
+            boundary_ids = {}
+            for name in (prefix + " a", f"Boundary {token} \ue000"):
+                response = requests.post(f"{self.base_url}/users", json={
+                    'name': name, 'email': self.generate_unique_email("boundary"), 'password': 'testpass'
+                })
+                if response.status_code == 201:
+                    boundary_ids[name] = response.json()['id']
+            response = requests.get(f"{self.base_url}/users", params={'name': prefix})
+            self.assert_status_code(response, 200, "GET /users?name=<prefix ending in U+D7FF>")
+            if response.status_code == 200:
+                ids = [u['id'] for u in response.json()]
+                expected_ids = [boundary_ids.get(prefix + " a")]
+                self.log_test("Filters - Name prefix ending in U+D7FF", ids == expected_ids,
+                             "" if ids == expected_ids else f"Expected {expected_ids}, got {ids}")
+            
+            response = requests.get(f"{self.base_url}/users", params={'sort': 'email'})
+            self.assert_status_code(response, 422, "GET /users?sort=email")
+            
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("Filters - Connection", False, f"Request failed: {e}")
+    
+    def test_search(self):
+        """Test: Search users by name or email substring."""
+        print("\n🧪 Testing GET /users/search")
+        
+        # A token unique to this run, so earlier runs do not match the search
+        token = str(uuid.uuid4()).replace('-', '')[:10]
+        created = []
+        for name, email in ((f"Search {token}", f"search_a_{token}@example.com"),
+                            ("Search Other", f"search_b_{token}@example.com")):
+            response = requests.post(
+                f"{self.base_url}/users",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps({'name': name, 'email': email, 'password': 'testpass'})
+            )
+            if response.status_code == 201:
+                created.append(response.json())
+        
+        try:
+            # Matches anywhere in the name or email, case-insensitively; name matches rank first
+            response = requests.get(f"{self.base_url}/users/search", params={'q': token[2:].upper()})
+            self.assert_status_code(response, 200, "GET /users/search?q=...")
+            ids = [u['id'] for u in response.json()]
+            expected_ids = [u['id'] for u in created]
+            self.log_test("Search - Substring in name or email", ids == expected_ids,
+                         f"Expected {expected_ids}, got {ids}")
+            
+            # Every term must match
+            response = requests.get(f"{self.base_url}/users/search", params={'q': f"other {token}"})
+            ids = [u['id'] for u in response.json()]
+            self.log_test("Search - All terms match", ids == expected_ids[1:],
+                         f"Expected {expected_ids[1:]}, got {ids}")
+            
+            response = requests.get(f"{self.base_url}/users/search", params={'q': token, 'limit': 1})
+            next_link = response.headers.get('Link', '')
+            self.log_test("Search - Next page link", 'offset=1' in next_link and len(response.json()) == 1,
+                         f"Link header: {next_link!r}")
+            
+            response = requests.get(f"{self.base_url}/users/search", params={'q': f"{token} ab"})
+            self.assert_status_code(response, 400, "GET /users/search with a 2-character term")
+            
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("Search - Connection", False, f"Request failed: {e}")
+    
+    def test_compression(self):
+        """Test: Large responses are gzip-compressed with a weak ETag that 304s repeat; small ones are not."""
+        print("\n🧪 Testing response compression")
+
+        gzip = {'Accept-Encoding': 'gzip'}
+        try:
+            # Make the user list comfortably larger than the default 1 KiB threshold
+            if len(requests.get(f"{self.base_url}/users").content) < 4096:
+                response = requests.post(f"{self.base_url}/users/bulk", json=[
+                    {'name': f'Compressed User {i}', 'email': self.generate_unique_email(f"gzip{i}"), 'password': 'gzippass'}
+                    for i in range(40)
+                ])
+                self.assert_status_code(response, 200, "Compression - Bulk create users")
+
+            response = requests.get(f"{self.base_url}/users", headers=gzip)
+            self.assert_status_code(response, 200, "GET /users (gzip)")
+            if response.headers.get('Content-Encoding') is None and 'Vary' not in response.headers:
+                print("ℹ️  Skipped: start the API with COMPRESSION_ENABLED=1 to check compression")
+                return
+            self.log_test("GET /users (gzip) - Content-Encoding", response.headers.get('Content-Encoding') == 'gzip',
+                         f"Expected 'gzip', got '{response.headers.get('Content-Encoding')}'")
+            vary = response.headers.get('Vary', '')
+            self.log_test("GET /users (gzip) - Vary", 'accept-encoding' in vary.lower(),
+                         f"Expected Accept-Encoding in Vary, got '{vary}'")
+            etag = response.headers.get('ETag', '')
+            self.log_test("GET /users (gzip) - Weak ETag", etag.startswith('W/'), f"Got '{etag}'")
+
+            response = requests.get(f"{self.base_url}/users", headers={**gzip, 'If-None-Match': etag})
+            self.assert_status_code(response, 304, "GET /users (gzip, If-None-Match)")
+            self.log_test("GET /users (gzip, If-None-Match) - Same ETag", response.headers.get('ETag') == etag,
+                         f"Expected '{etag}', got '{response.headers.get('ETag')}'")
+
+            response = requests.get(f"{self.base_url}/users", params={'limit': 1}, headers=gzip)
+            self.assert_status_code(response, 200, "GET /users?limit=1 (gzip)")
+            passed = 'Content-Encoding' not in response.headers
+            self.log_test("GET /users?limit=1 (gzip) - Small body not compressed", passed,
+                         "" if passed else f"Got Content-Encoding '{response.headers.get('Content-Encoding')}'")
+
+            response = requests.get(f"{self.base_url}/users", headers={'Accept-Encoding': 'identity'})
+            self.assert_status_code(response, 200, "GET /users (identity)")
+            passed = 'Content-Encoding' not in response.headers
+            self.log_test("GET /users (identity) - Not compressed", passed,
+                         "" if passed else f"Got Content-Encoding '{response.headers.get('Content-Encoding')}'")
+            strong_etag = response.headers.get('ETag', '')
+            passed = strong_etag == etag[2:]
+            self.log_test("GET /users (identity) - Strong ETag", passed,
+                         "" if passed else f"Expected '{etag[2:]}', got '{strong_etag}'")
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("Compression - Connection", False, f"Request failed: {e}")
+
+    def test_write_queue(self):
+        """Test: Create, update and delete go through the group commit queue when it is enabled."""
+        print("\n🧪 Testing CRUD through the write queue")
+
+        try:
+            before = requests.get(f"{self.base_url}/stats/writes").json()
+            email = self.generate_unique_email("queued")
+            response = requests.post(f"{self.base_url}/users",
+                                     json={'name': 'Queued User', 'email': email, 'password': 'queuedpass'})
+            if not self.assert_status_code(response, 201, "Write queue - Create user"):
+                return
+            user_id = response.json()['id']
+            response = requests.put(f"{self.base_url}/users/{user_id}",
+                                    json={'name': 'Queued Renamed', 'email': email, 'password': 'queuedpass'})
+            self.assert_status_code(response, 200, "Write queue - Update user")
+            self.assert_json_field(response.json(), 'name', 'Queued Renamed', "Write queue - Update user")
+            response = requests.delete(f"{self.base_url}/users/{user_id}")
+            self.assert_status_code(response, 200, "Write queue - Delete user")
+            response = requests.get(f"{self.base_url}/users/{user_id}")
+            self.assert_status_code(response, 404, "Write queue - Deleted user is gone")
+
+            after = requests.get(f"{self.base_url}/stats/writes").json()
+            if not after.get('running'):
+                print("ℹ️  Skipped: start the API with WRITE_QUEUE_ENABLED=1 to check the write queue counters")
+                return
+            committed = after['writes'] - before['writes']
+            passed = committed >= 3
+            self.log_test("Write queue - Writes committed by the queue", passed,
+                         "" if passed else f"Expected at least 3 more writes, got {committed}")
+            passed = after['failed_batches'] == before['failed_batches']
+            self.log_test("Write queue - No failed batches", passed,
+                         "" if passed else f"{after['failed_batches'] - before['failed_batches']} batch(es) failed")
+
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            self.log_test("Write queue - Connection", False, f"Request failed: {e}")
+
+    def test_database_stats(self):
+        """Test: GET /stats/database reports the SQLite profile, its pragmas and the maintenance counters."""
+        print("\n🧪 Testing GET /stats/database")
+
+        try:
+            response = requests.get(f"{self.base_url}/stats/database")
+            if not self.assert_status_code(response, 200, "GET /stats/database"):
+                return
+            stats = response.json()
+            self.assert_json_has_fields(stats, [
+                'profile', 'pragmas', 'enabled', 'running', 'interval', 'wal_bytes', 'wal_truncate_bytes',
+                'checkpoints', 'truncate_checkpoints', 'busy_checkpoints', 'max_checkpoint_seconds',
+                'optimize_runs', 'errors'
+            ], "GET /stats/database")
+            counters = ['wal_bytes', 'checkpoints', 'truncate_checkpoints', 'busy_checkpoints', 'optimize_runs', 'errors']
+            bad = {name: stats.get(name) for name in counters if not isinstance(stats.get(name), int) or stats[name] < 0}
+            self.log_test("GET /stats/database - Counters are non-negative integers", not bad,
+                         "" if not bad else f"Got {bad}")
+            if stats.get('profile') is None:
+                print("ℹ️  Skipped: profile and pragma checks only apply to SQLite")
+                return
+            passed = stats['profile'] in ('safe', 'balanced', 'fast')
+            self.log_test("GET /stats/database - Profile", passed, "" if passed else f"Got '{stats['profile']}'")
+            pragmas = stats.get('pragmas') or {}
+            self.assert_json_has_fields(pragmas, [
+                'journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'wal_autocheckpoint', 'busy_timeout'
+            ], "GET /stats/database pragmas")
+            self.assert_json_field(pragmas, 'journal_mode', 'wal', "GET /stats/database pragmas")
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("GET /stats/database - Connection", False, f"Request failed: {e}")
+
+    def test_hashing_load_shedding(self):
+        """Test: Creates beyond the password hashing queue bound get 503 and are counted as rejected."""
+        print("\n🧪 Testing password hashing load shedding (503)")
+
+        try:
+            before = requests.get(f"{self.base_url}/stats/hashing").json()
+            if before.get('max_pending', 0) > 1:
+                print("ℹ️  Skipped: start the API with PASSWORD_HASH_MAX_PENDING=1 to check load shedding")
+                return
+
+            def create(i):
+                return requests.post(f"{self.base_url}/users", json={
+                    'name': f'Busy User {i}', 'email': self.generate_unique_email("busy"), 'password': 'busypass'
+                })
+
+            with ThreadPoolExecutor(max_workers=24) as pool:
+                responses = list(pool.map(create, range(24)))
+            self.created_users.extend(response.json() for response in responses if response.status_code == 201)
+            codes = [response.status_code for response in responses]
+            shed = [response for response in responses if response.status_code == 503]
+            passed = set(codes) <= {201, 503} and len(shed) > 0
+            self.log_test("Load shedding - Some creates get 503", passed,
+                         "" if passed else f"Got status codes {sorted(codes)}")
+            passed = all(response.headers.get('Retry-After') for response in shed)
+            self.log_test("Load shedding - 503 has Retry-After", passed,
+                         "" if passed else "A 503 response has no Retry-After header")
+
+            after = requests.get(f"{self.base_url}/stats/hashing").json()
+            rejected = after['rejected'] - before['rejected']
+            passed = rejected == len(shed)
+            self.log_test("Load shedding - Counted as rejected", passed,
+                         "" if passed else f"Expected {len(shed)} more rejections, got {rejected}")
+
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            self.log_test("Load shedding - Connection", False, f"Request failed: {e}")
+
+    def test_metrics(self):
+        """Test: Prometheus metrics are recorded per route template."""
+        print("\n🧪 Testing GET /metrics")
+        
+        try:
+            requests.get(f"{self.base_url}/users/999999999")
+            response = requests.get(f"{self.base_url}/metrics")
+            self.assert_status_code(response, 200, "GET /metrics")
+            self.assert_content_type(response, "text/plain", "GET /metrics")
+            
+            text = response.text
+            self.log_test("Metrics - Route template label",
+                         'http_requests_total{method="GET",route="/users/{user_id}",status="404"}' in text,
+                         "Requests to /users/999999999 should be counted under /users/{user_id}")
+            self.log_test("Metrics - Raw paths are not labels", 'route="/users/999999999"' not in text,
+                         "User IDs should never appear as label values")
+            self.log_test("Metrics - Latency histogram and query counts",
+                         'http_request_duration_seconds_bucket{method="GET",route="/users/{user_id}",le="+Inf"}' in text
+                         and 'db_queries_total{method="GET",route="/users/{user_id}"}' in text,
+                         "Expected a latency histogram and query counter for /users/{user_id}")
+            
+        except requests.exceptions.RequestException as e:
+            self.log_test("Metrics - Connection", False, f"Request failed: {e}")
+    
+    def test_query_counts(self, user_id: int):
+        """Test: Endpoints stay within their query budget (needs the API started with QUERY_PROFILING=1)."""
+        print("\n🧪 Testing query counts (Server-Timing)")
+        
+        # Most queries each endpoint may run; raise a budget only together with the code that needs it
+        budgets = [
+            ("GET", "/users", None, 2),
+            ("GET", f"/users/{user_id}", None, 1),
+            ("GET", "/users/search", {'q': 'user'}, 1),
+            ("POST", "/users/batch-get", [user_id, 999999999], 1),
+        ]
+        try:
+            for method, path, payload, budget in budgets:
+                if method == "GET":
+                    response = requests.get(f"{self.base_url}{path}", params=payload)
+                else:
+                    response = requests.post(f"{self.base_url}{path}", json=payload)
+                match = re.search(r'db;[^,]*desc="(\d+) quer', response.headers.get('Server-Timing', ''))
+                if match is None:
+                    print("ℹ️  Skipped: start the API with QUERY_PROFILING=1 to check query counts")
+                    return
+                queries = int(match.group(1))
+                self.log_test(f"Query count - {method} {path}", queries <= budget,
+                             f"{queries} queries, budget {budget}")
+            
+        except requests.exceptions.RequestException as e:
+            self.log_test("Query count - Connection", False, f"Request failed: {e}")
+    
+    def test_admin_requires_token(self):
+        """Test: The profiler endpoint rejects requests without the admin token."""
+        print("\n🧪 Testing POST /admin/profile (authorization)")
+        
+        try:
+            # 404 when no ADMIN_TOKEN is configured, 401 otherwise
+            response = requests.post(f"{self.base_url}/admin/profile", params={'seconds': 1})
+            self.log_test("POST /admin/profile - Without token", response.status_code in (401, 404),
+                         f"Expected 401 or 404, got {response.status_code}")
+            response = requests.post(f"{self.base_url}/admin/profile", params={'seconds': 1},
+                                     headers={'Authorization': 'Bearer wrong-token'})
+            self.log_test("POST /admin/profile - Wrong token", response.status_code in (401, 404),
+                         f"Expected 401 or 404, got {response.status_code}")
+            
+        except requests.exceptions.RequestException as e:
+            self.log_test("POST /admin/profile - Connection", False, f"Request failed: {e}")
+    
+    def test_export_users(self):
+        """Test: Export all users as NDJSON."""
+        print("\n🧪 Testing GET /users/export (NDJSON)")
+        
+        try:
+            response = requests.get(f"{self.base_url}/users/export", stream=True)
+            
+            # Validate status code and content-type
+            self.assert_status_code(response, 200, "GET /users/export")
+            self.assert_content_type(response, "application/x-ndjson", "GET /users/export")
+            
+            if response.status_code == 200:
+                exported = [json.loads(line) for line in response.iter_lines() if line]
+                
+                # The export should contain the same users as the list endpoint
+                expected_ids = sorted(u['id'] for u in self.get_all_users())
+                exported_ids = [u.get('id') for u in exported]
+                passed = exported_ids == expected_ids
+                self.log_test("GET /users/export - Same users as GET /users", passed,
+                             f"Expected {len(expected_ids)} users, got {len(exported_ids)}")
+                
+                # Passwords must not be exported
+                passed = all('password' not in u and 'hashed_password' not in u for u in exported)
+                self.log_test("GET /users/export - Password not in export", passed,
+                             "Password should not be exported")
+            
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("GET /users/export - Connection", False, f"Request failed: {e}")
+    
+    def test_bulk_create_users(self):
+        """Test: Create several users in one request, including a duplicate email."""
+        print("\n🧪 Testing POST /users/bulk")
+        
+        new_email = self.generate_unique_email("bulk")
+        bulk_users = [
+            {'name': 'Bulk User 1', 'email': new_email, 'password': 'testpass'},
+            {'name': 'Bulk User 2', 'email': 'admin@example.com', 'password': 'testpass'},  # Email that already exists
+            {'name': 'Bulk User 3', 'email': new_email, 'password': 'testpass'},  # Repeated in the same request
+        ]
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/users/bulk",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps(bulk_users)
+            )
+            
+            self.assert_status_code(response, 200, "POST /users/bulk")
+            self.assert_content_type(response, "application/json", "POST /users/bulk")
+            
+            if response.status_code == 200:
+                results = response.json()
+                passed = [r.get('success') for r in results] == [True, False, False]
+                self.log_test("POST /users/bulk - Per-item results", passed,
+                             f"Expected [True, False, False], got {[r.get('success') for r in results]}")
+                
+                if results and results[0].get('user'):
+                    created = results[0]['user']
+                    self.assert_json_field(created, 'email', new_email, "POST /users/bulk")
+                    self.created_users.append(created)
+                
+                passed = all(r.get('detail') == "Email already registered" for r in results[1:])
+                self.log_test("POST /users/bulk - Duplicate error message", passed,
+                             "Duplicates should report 'Email already registered'")
+            
+        except requests.exceptions.RequestException as e:
+            self.log_test("POST /users/bulk - Connection", False, f"Request failed: {e}")
+    
+    def test_batch_get(self, user_id: int):
+        """Test: Get several users by ID in one request, including a missing ID."""
+        print("\n🧪 Testing POST /users/batch-get")
+        
+        missing_id = 999999999
+        try:
+            response = requests.post(
+                f"{self.base_url}/users/batch-get",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps([missing_id, user_id, user_id])
+            )
+            
+            self.assert_status_code(response, 200, "POST /users/batch-get")
+            
+            if response.status_code == 200:
+                results = response.json()
+                ids = [r.get('id') for r in results]
+                found = [r.get('found') for r in results]
+                self.log_test("POST /users/batch-get - Request order", ids == [missing_id, user_id, user_id],
+                             f"Expected {[missing_id, user_id, user_id]}, got {ids}")
+                self.log_test("POST /users/batch-get - Not-found marker", found == [False, True, True]
+                             and results[0].get('user') is None, f"Got {found}")
+                
+                expected = requests.get(f"{self.base_url}/users/{user_id}").json()
+                self.log_test("POST /users/batch-get - User data", results[1].get('user') == expected,
+                             f"Expected {expected}, got {results[1].get('user')}")
+            
+            # A full batch spans several IN lookups; the known user is in the last one
+            user_ids = list(range(missing_id - 999, missing_id)) + [user_id]
+            response = requests.post(
+                f"{self.base_url}/users/batch-get",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps(user_ids)
+            )
+            self.assert_status_code(response, 200, "POST /users/batch-get with 1000 IDs")
+            if response.status_code == 200:
+                results = response.json()
+                passed = [r.get('id') for r in results] == user_ids and [r.get('found') for r in results] == [False] * 999 + [True]
+                self.log_test("POST /users/batch-get with 1000 IDs - Results", passed,
+                             "" if passed else f"Got {len(results)} results, last {results[-1:]}")
+
+            response = requests.post(
+                f"{self.base_url}/users/batch-get",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps(list(range(1, 1002)))
+            )
+            self.assert_status_code(response, 400, "POST /users/batch-get over the size limit")
+            
+        except requests.exceptions.RequestException as e:
+            self.log_test("POST /users/batch-get - Connection", False, f"Request failed: {e}")
+    
+    def test_conditional_get(self, user_id: int):
+        """Test: ETag and If-None-Match on GET /users/{id} and GET /users."""
+        print("\n🧪 Testing conditional GET (ETag / If-None-Match)")
+        
+        try:
+            for path in (f"/users/{user_id}", "/users"):
+                response = requests.get(f"{self.base_url}{path}")
+                etag = response.headers.get('ETag')
+                self.log_test(f"GET {path} - ETag header", etag is not None, "Response should carry an ETag")
+                if etag is None:
+                    continue
+                
+                # An unchanged resource should answer 304 with an empty body
+                response = requests.get(f"{self.base_url}{path}", headers={'If-None-Match': etag})
+                self.assert_status_code(response, 304, f"GET {path} (If-None-Match)")
+                passed = response.content == b""
+                self.log_test(f"GET {path} (If-None-Match) - Empty body", passed,
+                             f"Expected no body, got {len(response.content)} bytes")
+                
+                # A stale ETag should get the full response again
+                response = requests.get(f"{self.base_url}{path}", headers={'If-None-Match': '"stale"'})
+                self.assert_status_code(response, 200, f"GET {path} (stale If-None-Match)")
+            
+        except requests.exceptions.RequestException as e:
+            self.log_test("Conditional GET - Connection", False, f"Request failed: {e}")
+    
+    def test_etag_after_delete(self):
+        """Test: A user created after deleting the newest one never matches the deleted user's ETag."""
+        print("\n🧪 Testing conditional GET after delete and create")
+
+        def create(prefix):
+            response = requests.post(f"{self.base_url}/users",
+                                     json={'name': 'ETag User', 'email': self.generate_unique_email(prefix),
+                                           'password': 'testpass'})
+            return response.json() if response.status_code == 201 else None
+
+        try:
+            deleted = create("etag_deleted")
+            if deleted is None:
+                self.log_test("ETag after delete - Create user", False, "Could not create a user")
+                return
+            old_etag = requests.get(f"{self.base_url}/users/{deleted['id']}").headers.get('ETag')
+            requests.delete(f"{self.base_url}/users/{deleted['id']}")
+            created = create("etag_created")
+            if created is None:
+                self.log_test("ETag after delete - Create user", False, "Could not create a user")
+                return
+            self.created_users.append(created)
+
+            passed = created['id'] != deleted['id']
+            self.log_test("ETag after delete - ID not reused", passed,
+                         "" if passed else f"The new user got the deleted user's ID {deleted['id']}")
+            for user_id in sorted({deleted['id'], created['id']}):
+                response = requests.get(f"{self.base_url}/users/{user_id}", headers={'If-None-Match': old_etag})
+                passed = response.status_code != 304
+                self.log_test(f"ETag after delete - GET /users/{user_id} with the old ETag", passed,
+                             "" if passed else "Got 304 for a user the client never saw")
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("ETag after delete - Connection", False, f"Request failed: {e}")
+
+    def test_cache_invalidation(self):
+        """Test: PUT and DELETE invalidate the cached user under its ID and its email."""
+        print("\n🧪 Testing user cache invalidation (by ID and by email)")
+
+        old_email = self.generate_unique_email("cache")
+        new_email = self.generate_unique_email("cache_renamed")
+        try:
+            response = requests.post(f"{self.base_url}/users",
+                                     json={'name': 'Cached User', 'email': old_email, 'password': 'testpass'})
+            if not self.assert_status_code(response, 201, "Cache - Create user"):
+                return
+            user_id = response.json()['id']
+
+            # Fill the cache under both keys
+            requests.get(f"{self.base_url}/users/{user_id}")
+            response = requests.get(f"{self.base_url}/users", params={'email': old_email})
+            self.log_test("Cache - Lookup by email", [u.get('id') for u in response.json()] == [user_id],
+                         f"Expected user {user_id}, got {response.json()}")
+
+            response = requests.put(f"{self.base_url}/users/{user_id}",
+                                    json={'name': 'Renamed User', 'email': new_email, 'password': 'testpass'})
+            self.assert_status_code(response, 200, "Cache - Update user")
+
+            by_id = requests.get(f"{self.base_url}/users/{user_id}").json()
+            self.log_test("Cache - PUT invalidates by ID",
+                         by_id.get('name') == 'Renamed User' and by_id.get('email') == new_email, f"Got {by_id}")
+            old_lookup = requests.get(f"{self.base_url}/users", params={'email': old_email}).json()
+            self.log_test("Cache - PUT invalidates the old email", old_lookup == [], f"Got {old_lookup}")
+            new_lookup = requests.get(f"{self.base_url}/users", params={'email': new_email}).json()
+            self.log_test("Cache - New email finds the updated user",
+                         [u.get('name') for u in new_lookup] == ['Renamed User'], f"Got {new_lookup}")
+
+            response = requests.delete(f"{self.base_url}/users/{user_id}")
+            self.assert_status_code(response, 200, "Cache - Delete user")
+            response = requests.get(f"{self.base_url}/users/{user_id}")
+            self.assert_status_code(response, 404, "Cache - DELETE invalidates by ID")
+            lookup = requests.get(f"{self.base_url}/users", params={'email': new_email}).json()
+            self.log_test("Cache - DELETE invalidates by email", lookup == [], f"Got {lookup}")
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_test("Cache - Connection", False, f"Request failed: {e}")
+
     def run_all_tests(self):
         """Runs all tests."""
         print("🚀 Starting Enhanced API Tests")
@@ -343,12 +1036,30 @@ class APITesterEnhanced:
         initial_users = self.test_get_initial_users()
         created_user = self.test_create_user()
         self.test_create_duplicate_user()
+        self.test_concurrent_duplicate_create()
+        self.test_update_duplicate_email()
         
         if created_user and 'id' in created_user:
             self.test_get_user_by_id(created_user['id'])
+            self.test_conditional_get(created_user['id'])
+            self.test_etag_after_delete()
+            self.test_batch_get(created_user['id'])
+            self.test_query_counts(created_user['id'])
         
         self.test_get_nonexistent_user()
         self.test_data_persistence()
+        self.test_pagination()
+        self.test_filters()
+        self.test_cache_invalidation()
+        self.test_search()
+        self.test_export_users()
+        self.test_bulk_create_users()
+        self.test_compression()
+        self.test_write_queue()
+        self.test_database_stats()
+        self.test_hashing_load_shedding()
+        self.test_metrics()
+        self.test_admin_requires_token()
         
         # Final summary
         self.print_summary()
@@ -0,0 +1,161 @@
+"""
+Group commit of user writes: one writer thread commits the writes of concurrent requests together.
+
+Without it, every POST, PUT and DELETE commits its own transaction, and concurrent writers take
+turns on SQLite's write lock (waiting up to the busy timeout) and pay one journal sync each. With
+it, request threads hand their statements to a queue and wait; the writer thread takes up to
+max_batch of them, waiting at most max_wait seconds for a batch to fill, and runs them in a single
+transaction. Each write runs inside its own savepoint, so a write that fails (say, on the unique
+index on email) is rolled back alone and its error is raised to its caller, while the rest of
+the batch still commits. Results are only returned once the batch is committed.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# A write: runs Core statements on the batch's connection (or, when it is not queued, on the
+# request's session) and returns what the caller gets back
+WriteOperation = Callable[[Union[Connection, Session]], Any]
+
+
+class GroupCommitQueue:
+    """Single writer thread that commits queued writes in batches, with per-write savepoints."""
+
+    def __init__(self, engine: Engine, enabled: bool, max_batch: int, max_wait: float):
+        self.engine = engine
+        self.enabled = enabled
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max(max_wait, 0.0)
+        self._queue: "queue.Queue[Optional[Tuple[WriteOperation, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.failed_batches = 0
+        self.max_batch_size = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def submit(self, operation: WriteOperation) -> Optional[Future]:
+        """
+        Queues a write and returns a future of its result, or None when the queue is not
+        running, in which case the caller commits the write itself.
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._thread is None:
+                return None
+            self._queue.put((operation, future))
+        return future
+
+    def _next_batch(self) -> Tuple[List[Tuple[WriteOperation, Future]], bool]:
+        """Waits for the next write, then collects more until the batch is full or max_wait passes."""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Once max_wait has passed, only writes that are already queued join the batch
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, batch: List[Tuple[WriteOperation, Future]]):
+        """Runs a batch in one transaction and resolves each write's future once it is committed."""
+        outcomes = []
+        try:
+            # A Core connection rather than a Session: the writer thread runs every write of the
+            # process, so the ORM's per-statement bookkeeping would cap throughput
+            with self.engine.connect() as connection:
+                if self.engine.dialect.name == "sqlite":
+                    # pysqlite does not open a transaction before a SAVEPOINT, so without an explicit
+                    # BEGIN the first RELEASE would commit on its own. IMMEDIATE also takes the write
+                    # lock up front instead of upgrading to it halfway through the batch
+                    connection.exec_driver_sql("BEGIN IMMEDIATE")
+                for operation, future in batch:
+                    try:
+                        with connection.begin_nested():
+                            outcomes.append((future, operation(connection), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                connection.commit()
+        except Exception as e:
+            # The transaction itself failed, so none of the writes in it happened
+            logger.exception("Group commit of %d writes failed", len(batch))
+            with self._lock:
+                self.failed_batches += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.writes += len(batch)
+            self.failed_writes += sum(error is not None for _, _, error in outcomes)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._commit(batch)
+
+    def start(self):
+        """Starts the writer thread, when group commit is enabled."""
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops accepting writes and waits for the writer thread to commit the queued ones."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                # Queued after every accepted write, so the writer drains them before it exits
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns batch counters; writes_per_batch shows how much commits are being shared."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "running": self._thread is not None,
+                "max_batch": self.max_batch,
+                "max_wait": self.max_wait,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "writes": self.writes,
+                "failed_writes": self.failed_writes,
+                "failed_batches": self.failed_batches,
+                "writes_per_batch": self.writes / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+            }